@@ -1,14 +1,52 @@
-from forms import ArtistForm, VenueForm, ShowForm
+from forms import ArtistForm, VenueForm, ShowForm, ScheduleForm
+from cache import PageCache, NullCache
+from instrumentation import SQLInstrumentation
+from metrics import Metrics
+from recording import RequestRecorder
+from conditional import (
+    conditional,
+    listing_validators,
+    artist_validators,
+    venue_validators,
+)
 from logging import Formatter, FileHandler
-from model import db, Artist, Venue, Show
-from sqlalchemy.exc import SQLAlchemyError
+from model import db, load_profile, Artist, Venue, Show
+from pagination import paginate_request
+from routing import read_only
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import with_expression
 from flask_wtf.csrf import CSRFProtect, CSRFError
-from flask_migrate import Migrate
+from flask_migrate import Migrate, upgrade
 from flask_moment import Moment
-from flask import Flask, render_template, request, flash, redirect, url_for
+from flask import (
+    Flask,
+    Response,
+    abort,
+    render_template,
+    request,
+    flash,
+    jsonify,
+    redirect,
+    stream_with_context,
+    url_for,
+)
+from operator import attrgetter
+from functools import lru_cache
+from itertools import groupby
 
 import dateutil.parser
+import click
+import bulk
+import json
+import babel.dates
 import logging
+import schedule
+import search
+import facets
+import dbpool
+import replay
+import seed
+import benchmark
 import babel
 
 # ----------------------------------------------------------------------------#
@@ -19,8 +57,25 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object("config")
 csrf = CSRFProtect(app)
+dbpool.init_app(app)
 db.init_app(app)
 migrate = Migrate(app, db)
+page_cache = PageCache(app)
+sql_instrumentation = SQLInstrumentation(app)
+metrics = Metrics(app)
+
+
+@metrics.add_collector
+def collect_pool_metrics(registry):
+    """Usage of the primary and replica connection pools."""
+    for bind in [None] + app.config["REPLICA_BINDS"]:
+        dbpool.collect_metrics(
+            registry, db.get_engine(app, bind=bind), bind or "primary")
+
+
+if app.config["REQUEST_RECORDING"]:
+    app.wsgi_app = RequestRecorder(
+        app.wsgi_app, app.config["REQUEST_RECORDING_PATH"])
 
 
 # ----------------------------------------------------------------------------#
@@ -28,24 +83,92 @@ migrate = Migrate(app, db)
 # ----------------------------------------------------------------------------#
 
 
+# Babel patterns of the named formats, parsed once instead of on every call.
+DATETIME_LOCALE = babel.Locale.parse("en")
+DATETIME_PATTERNS = {
+    "full": babel.dates.parse_pattern("EEEE MMMM, d, y 'at' h:mma"),
+    "medium": babel.dates.parse_pattern("EE MM, dd, y h:mma"),
+}
+
+
+@lru_cache(maxsize=4096)
+def _format_datetime(date, format_):
+    pattern = DATETIME_PATTERNS.get(format_)
+    if pattern is None:
+        pattern = babel.dates.parse_pattern(format_)
+    return pattern.apply(date, DATETIME_LOCALE)
+
+
 def format_datetime(value, format_="medium"):
-    date = dateutil.parser.parse(value)
-    if format_ == "full":
-        format_ = "EEEE MMMM, d, y 'at' h:mma"
-    elif format_ == "medium":
-        format_ = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format_, locale="en")
+    """
+    Formats a datetime, or a string holding one, with a named format ("full",
+    "medium") or a Babel pattern. Results are memoized, as the same show
+    times are rendered over and over.
+    """
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    return _format_datetime(value, format_)
 
 
 app.jinja_env.filters["datetime"] = format_datetime
 
 
+# ----------------------------------------------------------------------------#
+# Cache invalidation.
+# ----------------------------------------------------------------------------#
+
+
+def venue_page_tags(venue_id):
+    """
+    Cache tags of the pages showing a venue: its own page, the show listing
+    and the pages of the artists playing there.
+    """
+    artist_ids = (
+        db.session.query(Show.artist_id)
+        .filter(Show.venue_id == venue_id)
+        .distinct()
+    )
+    return [f"venue:{venue_id}", "shows"] + [
+        f"artist:{artist_id}" for artist_id, in artist_ids
+    ]
+
+
+def artist_page_tags(artist_id):
+    """
+    Cache tags of the pages showing an artist: its own page, the show
+    listing and the pages of the venues it plays at.
+    """
+    venue_ids = (
+        db.session.query(Show.venue_id)
+        .filter(Show.artist_id == artist_id)
+        .distinct()
+    )
+    return [f"artist:{artist_id}", "shows"] + [
+        f"venue:{venue_id}" for venue_id, in venue_ids
+    ]
+
+
+def stream_template(template_name, **context):
+    """
+    Renders a template while the response is sent, as stream_template of
+    later Flask versions does. Rows the template loops over can be fetched
+    as it goes, in the request context kept alive by stream_with_context.
+    """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(50)
+    return Response(stream_with_context(stream))
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
 
 @app.route("/")
+@read_only
+@conditional(listing_validators(Artist, Venue))
+@page_cache.cached("artists", "venues")
 def index():
     """
     App's main entry point
@@ -54,8 +177,18 @@ def index():
         on GET: Lists recently listed Artists and Venues
     """
 
-    artists = Artist.query.order_by(Artist.id.desc()).limit(10).all()
-    venues = Venue.query.order_by(Venue.id.desc()).limit(10).all()
+    artists = (
+        load_profile(Artist, "list")
+        .order_by(Artist.id.desc())
+        .limit(10)
+        .all()
+    )
+    venues = (
+        load_profile(Venue, "list")
+        .order_by(Venue.id.desc())
+        .limit(10)
+        .all()
+    )
 
     return render_template("pages/home.html", artists=artists, venues=venues)
 
@@ -66,44 +199,60 @@ def index():
 
 
 @app.route("/venues")
+@read_only
+@conditional(listing_validators(Venue))
+@page_cache.cached("venues")
 def venues():
     """
-    Shows available venues grouped by place.
+    Shows available venues grouped by place. Areas, venues and their upcoming
+    show counts are fetched in a single query, one page at a time. The
+    `genre`, `state` and `city` arguments narrow the list, e.g.
+    /venues?genre=Jazz&state=NY.
     """
 
-    venues = Venue.query.all()
-    places = Venue.query.distinct(Venue.city, Venue.state).all()
-    areas = []
-    for place in places:
-        areas.append(
-            {
-                "city": place.city,
-                "state": place.state,
-                "venues": [
-                    {
-                        "id": venue.id,
-                        "name": venue.name,
-                        "upcoming_shows_count": venue.upcoming_shows_count,
-                    }
-                    for venue in venues
-                    if venue.city == place.city and venue.state == place.state
-                ],
-            }
-        )
-    return render_template("pages/venues.html", areas=areas)
+    query = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count,
+    )
+    page = paginate_request(
+        facets.filtered(query, Venue, facets.filter_args(request.args)),
+        keys=(Venue.city, Venue.state, Venue.id),
+    )
+    areas = [
+        {
+            "city": city,
+            "state": state,
+            "venues": [
+                {
+                    "id": row.id,
+                    "name": row.name,
+                    "upcoming_shows_count": row.upcoming_shows_count,
+                }
+                for row in group
+            ],
+        }
+        for (city, state), group in groupby(
+            page, key=attrgetter("city", "state"))
+    ]
+    return render_template("pages/venues.html", areas=areas, page=page)
 
 
 @app.route("/venues/search", methods=["POST"])
+@read_only
 def search_venues():
     """
     Search function called from venues page.
 
     Returns:
-        on POST: Searches for venues and lists found entries.
+        on POST: Searches for venues and lists found entries, most relevant
+        first.
     """
 
     search_term = request.form.get("search_term", "")
-    results = Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).all()
+    results = search.ranked(Venue, search_term).all()
     response = {
         "count": len(results),
         "data": [
@@ -121,6 +270,9 @@ def search_venues():
 
 
 @app.route("/venues/<int:venue_id>")
+@read_only
+@conditional(venue_validators)
+@page_cache.cached("venue:{venue_id}")
 def show_venue(venue_id):
     """
     Loads venue's page.
@@ -132,7 +284,8 @@ def show_venue(venue_id):
         on GET: Shows venue's detailed page based on the id.
     """
     return render_template(
-        "pages/show_venue.html", venue=Venue.query.get_or_404(venue_id)
+        "pages/show_venue.html",
+        venue=load_profile(Venue, "detail").get_or_404(venue_id),
     )
 
 
@@ -167,6 +320,7 @@ def create_venue_submission():
         form.populate_obj(venue)
         db.session.add(venue)
         db.session.commit()
+        page_cache.invalidate("venues")
         flash(f"Venue {form.name.data} was successfully listed!")
     except SQLAlchemyError as error:
         app.logger.error(error)
@@ -195,11 +349,13 @@ def delete_venue(venue_id):
     Returns:
         on POST: Deletes venue row from database.
     """
-    venue = Venue.query.get_or_404(venue_id)
+    venue = load_profile(Venue, "delete").get_or_404(venue_id)
+    tags = venue_page_tags(venue_id)
 
     try:
         db.session.delete(venue)
         db.session.commit()
+        page_cache.invalidate("venues", "artists", *tags)
         flash(f"Venue {venue.name} was successfully deleted!")
     except SQLAlchemyError as error:
         app.logger.error(error)
@@ -244,6 +400,7 @@ def edit_venue_submission(venue_id):
     try:
         form.populate_obj(venue)
         db.session.commit()
+        page_cache.invalidate("venues", *venue_page_tags(venue_id))
         flash(f"Venue {form.name.data} was successfully updated!")
     except Exception as error:
         app.logger.error(error)
@@ -262,26 +419,38 @@ def edit_venue_submission(venue_id):
 
 
 @app.route("/artists")
+@read_only
+@conditional(listing_validators(Artist))
+@page_cache.cached("artists")
 def artists():
     """
     Shows available artists.
 
     Returns:
-        on GET: Lists all artists from the database
+        on GET: Lists artists from the database ordered by name, one page at
+        a time, narrowed by the `genre`, `state` and `city` arguments.
     """
-    return render_template("pages/artists.html", artists=Artist.query.all())
+    query = db.session.query(
+        Artist.id, Artist.name, Artist.upcoming_shows_count)
+    artists = paginate_request(
+        facets.filtered(query, Artist, facets.filter_args(request.args)),
+        keys=(Artist.name, Artist.id),
+    )
+    return render_template("pages/artists.html", artists=artists)
 
 
 @app.route("/artists/search", methods=["POST"])
+@read_only
 def search_artists():
     """
     Search function called from artist page.
 
     Returns:
-        on POST: Searches for artist and lists found entries.
+        on POST: Searches for artist and lists found entries, most relevant
+        first.
     """
     search_term = request.form.get("search_term", "")
-    results = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all()
+    results = search.ranked(Artist, search_term).all()
     response = {
         "count": len(results),
         "data": [
@@ -299,6 +468,9 @@ def search_artists():
 
 
 @app.route("/artists/<int:artist_id>")
+@read_only
+@conditional(artist_validators)
+@page_cache.cached("artist:{artist_id}")
 def show_artist(artist_id):
     """
     Loads artist's page.
@@ -310,7 +482,8 @@ def show_artist(artist_id):
         on GET: Shows artist's detailed page based on the id.
     """
     return render_template(
-        "pages/show_artist.html", artist=Artist.query.get_or_404(artist_id)
+        "pages/show_artist.html",
+        artist=load_profile(Artist, "detail").get_or_404(artist_id),
     )
 
 
@@ -345,6 +518,7 @@ def create_artist_submission():
         form.populate_obj(artist)
         db.session.add(artist)
         db.session.commit()
+        page_cache.invalidate("artists")
         flash(f"Artist {form.name.data} was successfully listed!")
     except Exception as error:
         app.logger.error(error)
@@ -372,11 +546,13 @@ def delete_artist(artist_id):
     Returns:
         on POST: Deletes artist row from database.
     """
-    artist = Artist.query.get_or_404(artist_id)
+    artist = load_profile(Artist, "delete").get_or_404(artist_id)
+    tags = artist_page_tags(artist_id)
 
     try:
         db.session.delete(artist)
         db.session.commit()
+        page_cache.invalidate("artists", "venues", *tags)
         flash(f"Artist {artist.name} was successfully deleted!")
     except Exception as error:
         app.logger.error(error)
@@ -427,6 +603,7 @@ def edit_artist_submission(artist_id):
     try:
         form.populate_obj(artist)
         db.session.commit()
+        page_cache.invalidate("artists", *artist_page_tags(artist_id))
         flash(f"Artist {form.name.data} was successfully updated!")
     except Exception as error:
         app.logger.error(error)
@@ -445,11 +622,44 @@ def edit_artist_submission(artist_id):
 
 
 @app.route("/shows")
+@read_only
+@conditional(listing_validators(Show, Artist, Venue))
+@page_cache.cached("shows")
 def shows():
     """
-    Shows available shows.
+    Shows available shows in chronological order, one page at a time.
+
+    `from` and `to` (YYYY-MM-DD, included) limit the list to a window of
+    days, `venue_id`, `artist_id` and `city` to a venue, artist or city.
+    With `group` set to day, week or month, shows are listed under their
+    calendar period and its show count, both computed in SQL. A window with
+    both ends is listed whole instead of paginated, and streamed, so the
+    page starts rendering in the browser before all shows are fetched.
     """
-    return render_template("pages/shows.html", shows=Show.query.all())
+    try:
+        filters = schedule.filter_args(request.args)
+    except ValueError:
+        abort(400)
+    period = request.args.get("group") or None
+    if period is not None and period not in schedule.PERIODS:
+        abort(400)
+
+    query = schedule.filtered(load_profile(Show, "list"), filters)
+    counts = {}
+    if period:
+        query = query.options(
+            with_expression(Show.period, schedule.period_start(period)))
+        counts = schedule.period_counts(filters, period)
+
+    context = dict(period=period, counts=counts, filters=request.args)
+    if "from" in filters and "to" in filters:
+        shows = query.order_by(Show._start_time, Show.id).yield_per(
+            schedule.STREAM_BATCH_SIZE)
+        return stream_template(
+            "pages/shows.html", shows=shows, page=None, **context)
+    page = paginate_request(query, keys=(Show._start_time, Show.id))
+    return render_template(
+        "pages/shows.html", shows=page, page=page, **context)
 
 
 # ----------------------------------------------------------------------------#
@@ -460,17 +670,56 @@ def shows():
 @app.route("/shows/create")
 def create_shows():
     """
-    Prepares the form for submission. Applies form validation. Uses drop-down
-    list to get the artist_id and venue_id.
+    Prepares the form for submission. Applies form validation. The artist
+    and venue are looked up while typing, see typeahead().
     """
     form = ShowForm()
-    artists = Artist.query.order_by(Artist.id).all()
-    venues = Venue.query.order_by(Venue.id).all()
-    form.artist_id.choices = [(a.id, a.name) for a in artists]
-    form.venue_id.choices = [(v.id, v.name) for v in venues]
     return render_template("forms/new_show.html", form=form)
 
 
+@app.route("/<any(artists, venues):kind>/typeahead")
+@read_only
+def typeahead(kind):
+    """
+    Suggests artists or venues whose name starts with the typed text.
+
+    Args:
+        kind: "artists" or "venues".
+
+    Returns:
+        JSON {"data": [{"id": ..., "name": ...}, ...]} ordered by name, at
+        most `limit` entries (default TYPEAHEAD_LIMIT, capped by
+        MAX_PAGE_SIZE).
+    """
+    model = Artist if kind == "artists" else Venue
+    limit = request.args.get(
+        "limit", app.config["TYPEAHEAD_LIMIT"], type=int)
+    limit = max(1, min(limit, app.config["MAX_PAGE_SIZE"]))
+    rows = search.prefixed(model, request.args.get("q", ""), limit)
+    return jsonify(data=[{"id": row.id, "name": row.name} for row in rows])
+
+
+@app.route("/<any(artists, venues):kind>/facets")
+@read_only
+def browse_facets(kind):
+    """
+    Counts artists or venues by genre, state and city, for faceted browsing.
+
+    Args:
+        kind: "artists" or "venues".
+
+    Returns:
+        JSON {"genres": [{"name": ..., "count": ...}, ...], "states": [...],
+        "cities": [...]}, most common first, for the rows matching the
+        `genre`, `state` and `city` arguments. Each facet ignores its own
+        argument, so it lists the alternatives to the current choice. At
+        most MAX_PAGE_SIZE cities are listed.
+    """
+    model = Artist if kind == "artists" else Venue
+    return jsonify(facets.counts(
+        model, facets.filter_args(request.args), app.config["MAX_PAGE_SIZE"]))
+
+
 @app.route("/shows/create", methods=["POST"])
 def create_show_submission():
     """
@@ -489,7 +738,24 @@ def create_show_submission():
         form.populate_obj(show)
         db.session.add(show)
         db.session.commit()
+        page_cache.invalidate(
+            "shows",
+            "venues",
+            "artists",
+            f"venue:{show.venue_id}",
+            f"artist:{show.artist_id}",
+        )
         flash("Show was successfully listed!")
+    except IntegrityError as error:
+        db.session.rollback()
+        booking = schedule.booking_conflict(error)
+        if booking is None:
+            app.logger.error(error)
+            flash("An error occurred. Show could not be listed.")
+        else:
+            # Booked by another request since the form was validated.
+            flash(booking[1])
+            return redirect(url_for("create_shows"))
     except Exception as error:
         app.logger.error(error)
         flash("An error occurred. Show could not be listed.")
@@ -500,6 +766,96 @@ def create_show_submission():
     return redirect(url_for("index"))
 
 
+@app.route("/shows/schedule")
+def schedule_shows():
+    """
+    Prepares the batch form of a tour or a residency. The artist and the
+    venue of the residency are looked up while typing, see typeahead().
+    """
+    form = ScheduleForm()
+    return render_template("forms/schedule_shows.html", form=form)
+
+
+@app.route("/shows/schedule", methods=["POST"])
+def schedule_shows_submission():
+    """
+    Handles the batch form. Every show is validated before any is listed,
+    then all of them are inserted in one transaction. The form is shown
+    again with the errors of each show otherwise.
+    """
+    form = ScheduleForm(request.form)
+
+    if not form.validate():
+        for _, messages in form.errors.items():
+            for message in messages:
+                flash(message)
+        return render_template("forms/schedule_shows.html", form=form), 400
+
+    try:
+        schedule.insert_batch(form.rows)
+        db.session.commit()
+        page_cache.invalidate(
+            "shows",
+            "venues",
+            "artists",
+            f"artist:{form.artist_id.data}",
+            *{f"venue:{row['venue_id']}" for row in form.rows},
+        )
+        flash(f"{len(form.rows)} shows were successfully listed!")
+    except IntegrityError as error:
+        db.session.rollback()
+        booking = schedule.booking_conflict(error)
+        if booking is None:
+            app.logger.error(error)
+            flash("An error occurred. Shows could not be listed.")
+        else:
+            # Booked by another request since the form was validated.
+            flash(booking[1])
+            return (
+                render_template("forms/schedule_shows.html", form=form),
+                400,
+            )
+    except Exception as error:
+        app.logger.error(error)
+        flash("An error occurred. Shows could not be listed.")
+        db.session.rollback()
+    finally:
+        db.session.close()
+
+    return redirect(url_for("index"))
+
+
+# ----------------------------------------------------------------------------#
+#  Export
+# ----------------------------------------------------------------------------#
+
+
+@app.route("/export/<kind>.<format_>")
+@read_only
+def export(kind, format_):
+    """
+    Streams a whole table as CSV, JSON lines or Parquet without loading it
+    into memory.
+
+    Args:
+        kind: "artists", "venues" or "shows".
+        format_: "csv", "jsonl" or "parquet".
+    """
+    if kind not in bulk.IMPORT_MODELS or format_ not in bulk.EXPORT_FORMATS:
+        abort(404)
+    try:
+        chunks = bulk.export_records(kind, format_)
+    except ImportError:
+        abort(501)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=bulk.EXPORT_FORMATS[format_],
+        headers={
+            "Content-Disposition": f"attachment; filename={kind}.{format_}"
+        },
+    )
+
+
 # ----------------------------------------------------------------------------#
 #  Error pages
 # ----------------------------------------------------------------------------#
@@ -532,6 +888,186 @@ def server_error(error):
     return render_template("errors/csrf.html"), 400
 
 
+# ----------------------------------------------------------------------------#
+#  Commands
+# ----------------------------------------------------------------------------#
+
+
+@app.cli.command("import")
+@click.argument("kind", type=click.Choice(list(bulk.IMPORT_MODELS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "format_", type=click.Choice(["csv", "jsonl"]),
+              help="File format, guessed from the extension by default.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows per insert statement and transaction.")
+@click.option("--copy/--no-copy", default=None,
+              help="Load with COPY, the default on PostgreSQL.")
+@click.option("--errors", "errors_path", type=click.Path(dir_okay=False),
+              help="Write rejected lines to this JSON lines file.")
+def import_command(kind, path, format_, batch_size, copy, errors_path):
+    """
+    Bulk imports artists, venues or shows from a CSV or JSON lines file.
+    Rows are validated with the rules of the matching form, invalid rows are
+    reported without aborting the import.
+    """
+    records = bulk.read_records(path, format_)
+    report = bulk.import_records(kind, records, batch_size, copy)
+
+    for error in report.errors[:20]:
+        click.echo(f"line {error['line']}: {'; '.join(error['errors'])}",
+                   err=True)
+    if errors_path:
+        with open(errors_path, "w") as file:
+            for error in report.errors:
+                file.write(json.dumps(error) + "\n")
+    click.echo(f"Imported {report.inserted} {kind}, "
+               f"rejected {len(report.errors)} rows.")
+    if report.inserted:
+        page_cache.invalidate(
+            "artists",
+            "venues",
+            "shows",
+            *[f"artist:{artist_id}" for artist_id in report.artist_ids],
+            *[f"venue:{venue_id}" for venue_id in report.venue_ids],
+        )
+
+
+@app.cli.command("export")
+@click.argument("kind", type=click.Choice(list(bulk.IMPORT_MODELS)))
+@click.option("--format", "format_", default="csv", show_default=True,
+              type=click.Choice(list(bulk.EXPORT_FORMATS)))
+@click.option("--output", "-o", default="-", show_default=True,
+              help="File to write, - for standard output.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows fetched from the database at a time.")
+def export_command(kind, format_, output, batch_size):
+    """
+    Streams artists, venues or shows to a CSV, JSON lines or Parquet file.
+    Memory use does not grow with the size of the table.
+    """
+    try:
+        chunks = bulk.export_records(kind, format_, batch_size)
+    except ImportError:
+        raise click.UsageError("Parquet export needs pyarrow installed.")
+    mode = "wb" if format_ == "parquet" else "w"
+    with click.open_file(output, mode) as file:
+        for chunk in chunks:
+            file.write(chunk)
+
+
+@app.cli.command("replay")
+@click.argument("trace", type=click.Path(exists=True, dir_okay=False))
+@click.option("--url", default=None,
+              help="Server to send the requests to, in process by default.")
+@click.option("--concurrency", default=1, show_default=True,
+              help="Requests sent in parallel.")
+@click.option("--method", "methods", multiple=True,
+              help="Only replay requests with this method, repeatable.")
+def replay_command(trace, url, concurrency, methods):
+    """
+    Replays recorded requests and reports throughput and p50/p95/p99
+    latency per route. Requests that write are replayed too, use --method
+    GET or a copy of the database.
+    """
+    records = list(replay.read_trace(trace, set(methods) or None))
+    runner = replay.HTTPRunner(url) if url else replay.TestClientRunner(app)
+    results, seconds = replay.replay(records, runner, concurrency)
+    click.echo(replay.format_summary(replay.summarize(app, results, seconds)))
+
+
+@app.cli.command("seed")
+@click.option("--artists", "artist_count", default=1000, show_default=True,
+              help="Number of artists to generate.")
+@click.option("--venues", "venue_count", default=200, show_default=True,
+              help="Number of venues to generate.")
+@click.option("--shows", "show_count", default=10000, show_default=True,
+              help="Number of shows to generate.")
+@click.option("--seed", "seed_", default=0, show_default=True,
+              help="Seed of the generator, the same seed gives the same data.")
+@click.option("--today", type=click.DateTime(["%Y-%m-%d"]), default=None,
+              help="Day shows are past or upcoming relative to, YYYY-MM-DD.")
+@click.option("--batch-size", default=10000, show_default=True,
+              help="Rows per insert statement and transaction.")
+@click.option("--copy/--no-copy", default=None,
+              help="Load with COPY, the default on PostgreSQL.")
+def seed_command(artist_count, venue_count, show_count, seed_, today,
+                 batch_size, copy):
+    """
+    Fills the database with generated artists, venues and shows for scale
+    testing. Most shows go to a few popular venues and artists, 70% of
+    them are in the past.
+    """
+    existing = {
+        "artist": [id_ for id_, in db.session.query(Artist.id)],
+        "venue": [id_ for id_, in db.session.query(Venue.id)],
+    }
+    try:
+        counts = seed.seed(artist_count, venue_count, show_count, seed_,
+                           today, batch_size, copy)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    click.echo(f"Generated {counts['artists']} artists, {counts['venues']} "
+               f"venues and {counts['shows']} shows.")
+    page_cache.invalidate(
+        "artists",
+        "venues",
+        "shows",
+        *[f"{kind}:{id_}" for kind, ids in existing.items() for id_ in ids],
+    )
+
+
+@app.cli.command("benchmark")
+@click.option("--size", "sizes", multiple=True, default=["small", "medium"],
+              type=click.Choice(list(benchmark.DATASETS)), show_default=True,
+              help="Dataset to benchmark against, repeatable.")
+@click.option("--repeat", default=10, show_default=True,
+              help="Requests per route, the median latency is reported.")
+@click.option("--threshold", type=float, default=None,
+              help="Allowed growth of latency and memory, defaults to "
+                   "BENCHMARK_THRESHOLD.")
+@click.option("--save", is_flag=True,
+              help="Save the results as the new baseline.")
+def benchmark_command(sizes, repeat, threshold, save):
+    """
+    Measures latency, SQL queries and peak memory of every route against
+    generated datasets in BENCHMARK_DATABASE_URI, whose data is replaced.
+    Fails when a route regressed compared to the saved baseline.
+    """
+    uri = app.config["BENCHMARK_DATABASE_URI"]
+    if not uri or uri == app.config["SQLALCHEMY_DATABASE_URI"]:
+        raise click.UsageError(
+            "Set BENCHMARK_DATABASE_URI to a database other than "
+            "SQLALCHEMY_DATABASE_URI, its data is deleted.")
+    if threshold is None:
+        threshold = app.config["BENCHMARK_THRESHOLD"]
+    path = app.config["BENCHMARK_BASELINE_PATH"]
+
+    # Pages are built on every request, without the page cache and CSRF
+    # tokens, against the up to date schema of the benchmark database. The
+    # migrations target PostgreSQL, SQLite databases, e.g. sqlite:// in
+    # memory, get their schema from the models.
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["WTF_CSRF_ENABLED"] = False
+    page_cache.backend = NullCache()
+    if db.engine.dialect.name == "sqlite":
+        db.create_all()
+    else:
+        upgrade()
+
+    results = benchmark.run(app, sizes, repeat)
+    click.echo(benchmark.format_results(results))
+    if save:
+        benchmark.write_baseline(path, results)
+        click.echo(f"Saved the baseline to {path}.")
+        return
+    regressions = benchmark.compare(
+        results, benchmark.read_baseline(path), threshold)
+    for regression in regressions:
+        click.echo(f"Regression: {regression}", err=True)
+    if regressions:
+        raise SystemExit(1)
+
+
 if not app.debug:
     file_handler = FileHandler("error.log")
     file_handler.setFormatter(
@@ -0,0 +1,287 @@
+from model import db, Artist, Venue, Show
+from datetime import datetime, timedelta
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
+from itertools import count
+
+import tracemalloc
+import statistics
+import json
+import time
+import seed
+
+# Rows generated by seed.py for each dataset size.
+DATASETS = {
+    "small": {"artist_count": 100, "venue_count": 20, "show_count": 1000},
+    "medium": {"artist_count": 1000, "venue_count": 200, "show_count": 10000},
+    "large": {
+        "artist_count": 10000, "venue_count": 2000, "show_count": 100000},
+}
+
+# Differences below these are noise, whatever the threshold.
+LATENCY_SLACK = 0.002
+MEMORY_SLACK = 64 * 1024
+
+# Matches about one in twenty generated names.
+SEARCH_TERM = "Blue"
+
+# Shows of each batch scheduled at once.
+TOUR_DATES = 20
+
+
+def _busiest(column):
+    """Id of the venue or artist with the most shows, whose pages are the
+    slowest to build."""
+    return (
+        db.session.query(column)
+        .group_by(column)
+        .order_by(db.func.count().desc(), column)
+        .limit(1)
+        .scalar()
+    )
+
+
+def _profile(name, **fields):
+    return dict(
+        name=name, city="Springfield", state="CA", phone="415-555-0100",
+        genres=["Jazz"], **fields)
+
+
+def routes():
+    """Requests covering the routes of app.py, from the seeded data.
+
+    Returns:
+        List of (name, request) tuples, in the order to run them. Requests
+        are functions returning the method, path and form data of a request,
+        called again for every repetition, so that each delete removes a
+        row of its own. Pages read before forms write.
+    """
+    venue_id = _busiest(Show.venue_id)
+    artist_id = _busiest(Show.artist_id)
+    numbers = count(1)
+    today = datetime.now().date()
+    start_time = datetime.combine(
+        today + timedelta(days=30), datetime.min.time())
+    # Shows added are on days of their own after the seeded ones, as the
+    # venue and artist can only be booked once at a time.
+    free_day = datetime.combine(
+        today + timedelta(days=seed.FUTURE_DAYS + 1), datetime.min.time())
+
+    def booking():
+        return free_day + timedelta(days=next(numbers))
+
+    def new_venue():
+        number = next(numbers)
+        venue = Venue(**_profile(
+            f"Benchmark Venue {number}", address=f"{number} Main Street"))
+        venue.shows = [Show(artist_id=artist_id, start_time=booking())]
+        db.session.add(venue)
+        db.session.commit()
+        return "POST", f"/venues/{venue.id}", None
+
+    def new_artist():
+        artist = Artist(**_profile(f"Benchmark Artist {next(numbers)}"))
+        artist.shows = [Show(venue_id=venue_id, start_time=booking())]
+        db.session.add(artist)
+        db.session.commit()
+        return "POST", f"/artists/{artist.id}", None
+
+    return [
+        ("index", lambda: ("GET", "/", None)),
+        ("venues", lambda: ("GET", "/venues", None)),
+        ("search_venues", lambda: (
+            "POST", "/venues/search", {"search_term": SEARCH_TERM})),
+        ("show_venue", lambda: ("GET", f"/venues/{venue_id}", None)),
+        ("artists", lambda: ("GET", "/artists", None)),
+        ("search_artists", lambda: (
+            "POST", "/artists/search", {"search_term": SEARCH_TERM})),
+        ("show_artist", lambda: ("GET", f"/artists/{artist_id}", None)),
+        ("shows", lambda: ("GET", "/shows", None)),
+        ("shows_calendar", lambda: (
+            "GET", f"/shows?group=week&from={today:%Y-%m-%d}"
+                   f"&to={start_time:%Y-%m-%d}", None)),
+        ("typeahead", lambda: (
+            "GET", f"/venues/typeahead?q={SEARCH_TERM}", None)),
+        ("export", lambda: ("GET", "/export/venues.csv", None)),
+        ("create_venue_form", lambda: ("GET", "/venues/create", None)),
+        ("edit_venue", lambda: ("GET", f"/venues/{venue_id}/edit", None)),
+        ("create_artist_form", lambda: ("GET", "/artists/create", None)),
+        ("edit_artist", lambda: ("GET", f"/artists/{artist_id}/edit", None)),
+        ("create_shows", lambda: ("GET", "/shows/create", None)),
+        ("schedule_shows", lambda: ("GET", "/shows/schedule", None)),
+        ("create_venue_submission", lambda: (
+            "POST", "/venues/create", _profile(
+                f"Benchmark Venue {next(numbers)}",
+                address="1 Main Street"))),
+        ("edit_venue_submission", lambda: (
+            "POST", f"/venues/{venue_id}/edit", _profile(
+                "Benchmark Venue", address="1 Main Street"))),
+        ("delete_venue", new_venue),
+        ("create_artist_submission", lambda: (
+            "POST", "/artists/create", _profile(
+                f"Benchmark Artist {next(numbers)}"))),
+        ("edit_artist_submission", lambda: (
+            "POST", f"/artists/{artist_id}/edit", _profile(
+                "Benchmark Artist"))),
+        ("delete_artist", new_artist),
+        ("create_show_submission", lambda: (
+            "POST", "/shows/create", {
+                "artist_id": artist_id, "venue_id": venue_id,
+                "start_time": f"{booking():%Y-%m-%d %H:%M:%S}"})),
+        ("schedule_shows_submission", lambda: (
+            "POST", "/shows/schedule", {
+                "artist_id": artist_id,
+                "dates": "\n".join(
+                    f"{venue_id}, {booking():%Y-%m-%d %H:%M:%S}"
+                    for _ in range(TOUR_DATES)),
+            })),
+    ]
+
+
+class QueryCounter:
+    """Counts the SQL statements run by all engines while active."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _executed(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(Engine, "before_cursor_execute", self._executed)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, "before_cursor_execute", self._executed)
+
+
+def measure(client, request, repeat=5):
+    """Runs a request `repeat` times, then once more tracing memory.
+
+    Returns:
+        Dict of the median latency in seconds, the SQL statements of one
+        request and the peak of memory allocated by Python while serving
+        it, in bytes.
+    """
+    latencies = []
+    queries = 0
+    for _ in range(repeat + 1):
+        method, path, data = request()
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+        response.close()
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"{method} {path} failed with {response.status_code}")
+        queries = counter.count
+
+    method, path, data = request()
+    tracemalloc.start()
+    try:
+        client.open(path, method=method, data=data).get_data()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # The first run warms up caches and connections.
+    return {
+        "seconds": statistics.median(latencies[1:]),
+        "queries": queries,
+        "memory": peak,
+    }
+
+
+def load_dataset(size):
+    """Replaces all artists, venues and shows with the dataset of a size."""
+    for model in (Show, Artist, Venue):
+        db.session.execute(db.delete(model))
+    db.session.commit()
+    seed.seed(**DATASETS[size])
+
+
+def run(app, sizes, repeat=5):
+    """Benchmarks every route against each dataset size.
+
+    Returns:
+        Dict of size to route name to measurements.
+    """
+    results = {}
+    client = app.test_client()
+    for size in sizes:
+        load_dataset(size)
+        results[size] = {
+            name: measure(client, request, repeat)
+            for name, request in routes()
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Routes slower, allocating more or running more SQL statements than in
+    the baseline.
+
+    Latency and memory regress when they grow by more than `threshold`, a
+    fraction of the baseline, and the slack. Any additional statement is a
+    regression, as their count does not vary from run to run.
+
+    Returns:
+        List of messages, empty when nothing regressed.
+    """
+    regressions = []
+    for size, measured in results.items():
+        for name, stats in measured.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            route = f"{size} {name}"
+            if stats["seconds"] > max(
+                before["seconds"] * (1 + threshold),
+                before["seconds"] + LATENCY_SLACK,
+            ):
+                regressions.append(
+                    f"{route}: {stats['seconds'] * 1000:.1f}ms, was "
+                    f"{before['seconds'] * 1000:.1f}ms")
+            if stats["memory"] > max(
+                before["memory"] * (1 + threshold),
+                before["memory"] + MEMORY_SLACK,
+            ):
+                regressions.append(
+                    f"{route}: {stats['memory'] / 1024:.0f}KiB peak memory, "
+                    f"was {before['memory'] / 1024:.0f}KiB")
+            if stats["queries"] > before["queries"]:
+                regressions.append(
+                    f"{route}: {stats['queries']} queries, was "
+                    f"{before['queries']}")
+    return regressions
+
+
+def read_baseline(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_baseline(path, results):
+    """Saves results as the baseline, keeping the sizes not benchmarked."""
+    baseline = read_baseline(path)
+    baseline.update(results)
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def format_results(results):
+    """Results as a table, latencies in milliseconds, memory in KiB."""
+    lines = [f"{'size':<8}{'route':<28}{'ms':>9}{'queries':>9}{'KiB':>9}"]
+    for size, measured in results.items():
+        for name, stats in measured.items():
+            lines.append(
+                f"{size:<8}{name:<28}{stats['seconds'] * 1000:>9.1f}"
+                f"{stats['queries']:>9}{stats['memory'] / 1024:>9.0f}")
+    return "\n".join(lines)
@@ -0,0 +1,464 @@
+from sqlalchemy.exc import SQLAlchemyError
+from model import db, Artist, Genre, Venue, Show, GENRE_LINKS
+from datetime import datetime
+from itertools import islice
+
+import validation
+import schedule
+import json
+import csv
+import io
+
+IMPORT_MODELS = {
+    "artists": (Artist, validation.ARTIST),
+    "venues": (Venue, validation.VENUE),
+    "shows": (Show, validation.SHOW),
+}
+
+# Form fields stored under another column name.
+COLUMN_NAMES = {"start_time": "_start_time"}
+# And back, exports use the field names imports read.
+FIELD_NAMES = {column: name for name, column in COLUMN_NAMES.items()}
+
+
+class ImportReport:
+    """Outcome of an import: inserted row count, per-line errors and, for
+    shows, the ids of the artists and venues that got new shows."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+        self.artist_ids = set()
+        self.venue_ids = set()
+
+    def reject(self, line, messages):
+        self.errors.append({"line": line, "errors": messages})
+
+
+def read_records(path, format_=None):
+    """Streams (line number, record) pairs from a CSV or JSON lines file.
+
+    The format is guessed from the extension unless given. In CSV files,
+    list fields such as genres are comma separated within their cell.
+    Unparsable JSON lines are yielded as None records.
+    """
+    format_ = format_ or ("jsonl" if path.endswith((".jsonl", ".ndjson"))
+                          else "csv")
+    with open(path, newline="", encoding="utf-8") as file:
+        if format_ == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line, text in enumerate(file, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except ValueError:
+                    record = None
+                yield line, record
+
+
+def validate_records(kind, records, known_ids=None):
+    """Validates a batch of records with the rules the matching form applies.
+
+    Args:
+        kind: "artists", "venues" or "shows".
+        records: Mappings of form field names to values.
+        known_ids: For shows, {"artist_id": ids, "venue_id": ids} of the
+            existing rows the show may refer to.
+
+    Yields:
+        (values, errors) per record, where values maps columns to the values
+        to insert, or is None when errors lists why the record is rejected.
+    """
+    _, schema = IMPORT_MODELS[kind]
+    now = datetime.utcnow()
+    for values, errors in schema.validate_many(records):
+        if errors:
+            yield None, [
+                f"{name}: {message}"
+                for name, messages in errors.items()
+                for message in messages
+            ]
+            continue
+
+        values = {COLUMN_NAMES.get(name, name): value
+                  for name, value in values.items()}
+        values["updated_at"] = now
+
+        errors = []
+        if known_ids:
+            for column in ("artist_id", "venue_id"):
+                if (column in values
+                        and values[column] not in known_ids[column]):
+                    errors.append(f"{column}: Unknown id {values[column]}.")
+        yield (None, errors) if errors else (values, [])
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _copy_value(value):
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return value
+
+
+def copy_rows(table, rows):
+    """Inserts rows with PostgreSQL COPY, the fastest way to load data."""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f'COPY "{table.name}" ({", ".join(columns)}) '
+        f"FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def insert_rows(table, rows, copy=False):
+    """Inserts a batch of rows in a single statement, with COPY or as an
+    executemany, which the psycopg2 dialect turns into multi-row VALUES."""
+    if copy:
+        copy_rows(table, rows)
+    else:
+        db.session.execute(table.insert(), rows)
+
+
+def _allocate_ids(table, count):
+    """Takes ids from the sequence of a table, for rows whose genre links
+    must be inserted along, as COPY and executemany cannot return them."""
+    return [
+        id_ for id_, in db.session.execute(
+            db.text(
+                "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                "FROM generate_series(1, :count)"
+            ),
+            {"table": f'"{table.name}"', "count": count},
+        )
+    ]
+
+
+def insert_records(model, rows, copy=False):
+    """Inserts a batch of rows like insert_rows, the genres of venues and
+    artists into their link table. The rows are left unchanged.
+
+    On PostgreSQL the ids come from the table sequence first, so rows and
+    links are both inserted in bulk. Elsewhere rows are inserted one by one
+    to get their ids.
+    """
+    table = model.__table__
+    if model not in GENRE_LINKS:
+        insert_rows(table, rows, copy=copy)
+        return
+
+    rows = [dict(row) for row in rows]
+    genres = [row.pop("genres", None) or [] for row in rows]
+    if db.engine.dialect.name == "postgresql":
+        for row, id_ in zip(rows, _allocate_ids(table, len(rows))):
+            row["id"] = id_
+        insert_rows(table, rows, copy=copy)
+    else:
+        for row in rows:
+            row["id"] = db.session.execute(
+                table.insert(), row).inserted_primary_key[0]
+
+    link, owner = GENRE_LINKS[model]
+    genre_ids = dict(db.session.query(Genre.name, Genre.id))
+    links = [
+        {owner.name: row["id"], "genre_id": genre_ids[name]}
+        for row, names in zip(rows, genres)
+        for name in set(names)
+        if name in genre_ids
+    ]
+    if links:
+        insert_rows(link, links, copy=copy)
+
+
+def touch_show_parents(rows, report):
+    """Bumps updated_at of the artists and venues of inserted shows, which
+    bulk inserts do not get from the ORM flush hook."""
+    now = datetime.utcnow()
+    for model, column, ids in (
+        (Artist, "artist_id", report.artist_ids),
+        (Venue, "venue_id", report.venue_ids),
+    ):
+        batch_ids = {row[column] for row in rows}
+        db.session.execute(
+            db.update(model)
+            .where(model.id.in_(batch_ids))
+            .values(updated_at=now)
+        )
+        ids.update(batch_ids)
+
+
+def _bookable(rows, report):
+    """Shows of a batch overlapping no booking of their venue or artist,
+    the others are reported with the booking they overlap."""
+    shows = [dict(values, start_time=values["_start_time"])
+             for _, values in rows]
+    bookable = []
+    for (line, values), booked in zip(rows, schedule.batch_conflicts(shows)):
+        if booked:
+            report.reject(line, [f"{column}: {message}"
+                                 for column, message in booked.items()])
+        else:
+            bookable.append((line, values))
+    return bookable
+
+
+def import_records(kind, records, batch_size=1000, copy=None):
+    """Validates and inserts records in batches, one transaction per batch.
+
+    Invalid records are reported and skipped, and so are shows overlapping
+    a booking of their venue or artist. When a batch fails in the database,
+    e.g. on a constraint, it is retried row by row so only the offending
+    rows are rejected.
+
+    Args:
+        kind: "artists", "venues" or "shows".
+        records: Iterable of (line number, record) pairs.
+        batch_size: Number of rows per insert statement and transaction.
+        copy: Use COPY, defaults to whether the database is PostgreSQL.
+
+    Returns:
+        ImportReport.
+    """
+    model, _ = IMPORT_MODELS[kind]
+    if copy is None:
+        copy = db.engine.dialect.name == "postgresql"
+    known_ids = None
+    if model is Show:
+        known_ids = {
+            "artist_id": {id_ for id_, in db.session.query(Artist.id)},
+            "venue_id": {id_ for id_, in db.session.query(Venue.id)},
+        }
+
+    report = ImportReport()
+    for batch in _batches(records, batch_size):
+        records = []
+        for line, record in batch:
+            if isinstance(record, dict):
+                records.append((line, record))
+            else:
+                report.reject(line, ["Malformed record."])
+        rows = []
+        results = validate_records(
+            kind, (record for _, record in records), known_ids)
+        for (line, _), (values, errors) in zip(records, results):
+            if errors:
+                report.reject(line, errors)
+            else:
+                rows.append((line, values))
+        if model is Show:
+            rows = _bookable(rows, report)
+        if not rows:
+            continue
+
+        try:
+            insert_records(model, [values for _, values in rows], copy=copy)
+            if model is Show:
+                touch_show_parents([values for _, values in rows], report)
+            db.session.commit()
+            report.inserted += len(rows)
+            continue
+        # COPY runs on the DBAPI cursor, its errors are not wrapped.
+        except (SQLAlchemyError, db.engine.dialect.dbapi.Error):
+            db.session.rollback()
+
+        for line, values in rows:
+            try:
+                insert_records(model, [values])
+                if model is Show:
+                    touch_show_parents([values], report)
+                db.session.commit()
+                report.inserted += 1
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                report.reject(
+                    line, [str(getattr(error, "orig", error)).strip()])
+    return report
+
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _genre_names(model):
+    """Comma separated genres of each venue or artist."""
+    link, owner = GENRE_LINKS[model]
+    if db.engine.dialect.name == "postgresql":
+        names = db.func.string_agg(Genre.name, ",")
+    else:
+        names = db.func.group_concat(Genre.name, ",")
+    return (
+        db.select(names)
+        .select_from(link)
+        .join(Genre, Genre.id == link.c.genre_id)
+        .where(owner == model.id)
+        .scalar_subquery()
+        .label("genres")
+    )
+
+
+def export_columns(kind):
+    """Names of the exported fields, the table columns under the names of
+    their form fields, and the genres of venues and artists."""
+    model = IMPORT_MODELS[kind][0]
+    columns = [FIELD_NAMES.get(column.name, column.name)
+               for column in model.__table__.c]
+    if model in GENRE_LINKS:
+        columns.append("genres")
+    return columns
+
+
+def _record(row):
+    record = dict(row._mapping)
+    if "genres" in record:
+        record["genres"] = sorted(
+            record["genres"].split(",") if record["genres"] else [])
+    return record
+
+
+def stream_partitions(kind, batch_size=1000):
+    """Streams the rows of a table in id order, batch by batch, as dicts
+    keyed by export_columns(). Genres are lists of names.
+
+    Rows are read through a server-side cursor where the database supports
+    one, so only a batch of rows is held in memory at any time.
+    """
+    model = IMPORT_MODELS[kind][0]
+    table = model.__table__
+    columns = [
+        column.label(FIELD_NAMES.get(column.name, column.name))
+        for column in table.c
+    ]
+    if model in GENRE_LINKS:
+        columns.append(_genre_names(model))
+    result = db.session.execute(
+        db.select(*columns)
+        .order_by(table.c.id)
+        .execution_options(stream_results=True)
+    )
+    for rows in result.yield_per(batch_size).partitions():
+        yield [_record(row) for row in rows]
+
+
+def _text_value(value):
+    if isinstance(value, list):
+        return ",".join(value)
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    return value
+
+
+def export_csv(kind, partitions):
+    """CSV chunks, one per batch, in the format `flask import` reads."""
+    columns = export_columns(kind)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in partitions:
+        writer.writerows(
+            [_text_value(row[column]) for column in columns] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_jsonl(kind, partitions):
+    """JSON lines chunks, one per batch."""
+    for rows in partitions:
+        yield "".join(
+            json.dumps({key: _text_value(value)
+                        for key, value in row.items()}) + "\n"
+            for row in rows
+        )
+
+
+def _arrow_schema(kind):
+    import pyarrow as pa
+
+    types = {
+        int: pa.int64(),
+        str: pa.string(),
+        bool: pa.bool_(),
+        datetime: pa.timestamp("us"),
+    }
+    model = IMPORT_MODELS[kind][0]
+    fields = [
+        (FIELD_NAMES.get(column.name, column.name),
+         types[column.type.python_type])
+        for column in model.__table__.c
+    ]
+    if model in GENRE_LINKS:
+        fields.append(("genres", pa.list_(pa.string())))
+    return pa.schema(fields)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write only file collecting what is written until it is drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def export_parquet(kind, partitions):
+    """Parquet chunks, every batch is written as a row group.
+
+    Raises:
+        ImportError: pyarrow, an optional dependency, is not installed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(kind)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in partitions:
+        writer.write_table(pa.Table.from_pylist(rows, schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+EXPORTERS = {"csv": export_csv, "jsonl": export_jsonl,
+             "parquet": export_parquet}
+
+
+def export_records(kind, format_, batch_size=1000):
+    """Streams a table as chunks of CSV, JSON lines (str) or Parquet (bytes).
+
+    Raises:
+        ImportError: Parquet was asked for without pyarrow installed.
+    """
+    if format_ == "parquet":
+        import pyarrow.parquet  # noqa: F401, fail before any row is read
+    return EXPORTERS[format_](kind, stream_partitions(kind, batch_size))
@@ -0,0 +1,265 @@
+from flask import current_app, g, make_response, request, session
+from flask_wtf.csrf import generate_csrf
+from collections import OrderedDict
+from markupsafe import Markup
+from functools import wraps
+from routing import pinned_to_primary
+
+import threading
+import hashlib
+import pickle
+import time
+import uuid
+import os
+
+# Rendered into cached pages instead of the per-session CSRF token, and
+# replaced by the token of the current session whenever a page is served.
+CSRF_PLACEHOLDER = "__page_cache_csrf_token__"
+
+
+class NullCache:
+    """Backend that stores nothing, used to disable caching."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class MemoryCache:
+    """In-process LRU cache whose entries expire after a time to live.
+
+    Args:
+        maxsize: Number of entries kept before the least recently used one
+            is evicted.
+        ttl: Default time to live in seconds, 0 keeps entries until evicted.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class FileSystemCache:
+    """Cache stored as one file per entry, shared by all worker processes
+    using the same directory.
+
+    Args:
+        directory: Folder holding the entries, created when missing.
+        ttl: Default time to live in seconds, 0 keeps entries forever.
+        threshold: Number of files above which expired and then the oldest
+            entries are pruned.
+    """
+
+    def __init__(self, directory, ttl=300, threshold=5000):
+        self.directory = directory
+        self.ttl = ttl
+        self.threshold = threshold
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(
+            self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as file:
+                expires, value = pickle.load(file)
+        except (OSError, EOFError, pickle.PickleError):
+            return None
+        if expires and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else 0
+        path = self._path(key)
+        # Written aside and renamed, so readers never see a partial entry.
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump((expires, value), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.directory)
+                   if not entry.name.endswith(".tmp")]
+        if len(entries) <= self.threshold:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[: len(entries) - self.threshold // 2]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def create_backend(config):
+    """Creates the backend named by PAGE_CACHE_BACKEND: "null", "memory" or
+    "filesystem"."""
+    name = config["PAGE_CACHE_BACKEND"]
+    if name == "null":
+        return NullCache()
+    if name == "memory":
+        return MemoryCache(
+            maxsize=config["PAGE_CACHE_MAXSIZE"], ttl=config["PAGE_CACHE_TTL"])
+    if name == "filesystem":
+        return FileSystemCache(
+            config["PAGE_CACHE_DIR"], ttl=config["PAGE_CACHE_TTL"])
+    raise ValueError(f"Unknown page cache backend {name!r}.")
+
+
+class PageCache:
+    """Caches rendered pages and template fragments.
+
+    Entries are tagged with the data they show, e.g. "venues" for the venue
+    listing or "venue:3" for the page of venue 3. Every tag has a random
+    version token stored in the backend and part of the cache key of the
+    entries, so invalidating a tag replaces its token and orphans all its
+    entries at once, in every process sharing the backend.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config)
+        app.context_processor(self._csrf_placeholder)
+        app.jinja_env.globals["cached_fragment"] = self.fragment
+
+    def _csrf_placeholder(self):
+        if g.get("page_cache_render"):
+            return {"csrf_token": lambda: CSRF_PLACEHOLDER}
+        return {}
+
+    def _tag_version(self, tag):
+        """Version token of a tag and when the tag was last invalidated."""
+        entry = self.backend.get(f"tag-version:{tag}")
+        if entry is None:
+            entry = (uuid.uuid4().hex, 0)
+            self.backend.set(f"tag-version:{tag}", entry, ttl=0)
+        return entry
+
+    def _key(self, kind, name, tags):
+        """Cache key of an entry and the last invalidation of its tags."""
+        entries = [self._tag_version(tag) for tag in tags]
+        versions = ",".join(version for version, _ in entries)
+        invalidated = max((time_ for _, time_ in entries), default=0)
+        return f"{kind}:{name}:{versions}", invalidated
+
+    def _storable(self, invalidated):
+        """Whether an entry just rendered may be stored.
+
+        A replica may still be REPLICA_STICKY_SECONDS behind the write that
+        invalidated the tags of the entry, and its rows from before the
+        write would be cached under the new tag versions. Entries rendered
+        from the primary are always stored.
+        """
+        if g.get("db_replica") is None:
+            return True
+        lag = current_app.config["REPLICA_STICKY_SECONDS"]
+        return time.time() >= invalidated + lag
+
+    def invalidate(self, *tags):
+        """Drops every page and fragment tagged with any of the tags."""
+        for tag in tags:
+            self.backend.set(
+                f"tag-version:{tag}", (uuid.uuid4().hex, time.time()), ttl=0)
+
+    def cached(self, *tags):
+        """Decorator caching the page rendered by a GET view.
+
+        Tags may refer to view arguments, e.g. "venue:{venue_id}". Pages are
+        cached per full path, so each query string is its own entry. Requests
+        with pending flash messages are rendered normally, as the messages
+        are part of the page, and so are requests of users who just wrote,
+        who must see their own changes.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if (request.method != "GET" or session.get("_flashes")
+                        or pinned_to_primary()):
+                    return view(**kwargs)
+
+                key, invalidated = self._key(
+                    "page",
+                    request.full_path,
+                    [tag.format(**kwargs) for tag in tags],
+                )
+                body = self.backend.get(key)
+                if body is None:
+                    g.page_cache_render = True
+                    try:
+                        response = make_response(view(**kwargs))
+                    finally:
+                        g.page_cache_render = False
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    body = response.get_data(as_text=True)
+                    if self._storable(invalidated):
+                        self.backend.set(key, body)
+                return body.replace(CSRF_PLACEHOLDER, generate_csrf())
+
+            return wrapper
+
+        return decorator
+
+    def fragment(self, name, *tags, caller):
+        """Caches the body of a template call block:
+
+            {% call cached_fragment("recent-venues", "venues") %}
+                ...
+            {% endcall %}
+        """
+        if pinned_to_primary():
+            return Markup(caller())
+        key, invalidated = self._key("fragment", name, tags)
+        body = self.backend.get(key)
+        if body is None:
+            body = str(caller())
+            if self._storable(invalidated):
+                self.backend.set(key, body)
+        return Markup(body)
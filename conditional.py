@@ -0,0 +1,176 @@
+from flask import current_app, make_response, request, session
+from flask_wtf.csrf import generate_csrf
+from werkzeug.http import is_resource_modified
+from model import db, Artist, Venue, Show
+from datetime import datetime, timezone
+from functools import wraps
+
+import hashlib
+import time
+
+
+def _csrf_renewed_at():
+    """Start of the current half of WTF_CSRF_TIME_LIMIT, in naive UTC.
+
+    Pages embed CSRF tokens that expire after WTF_CSRF_TIME_LIMIT seconds.
+    Their validators change whenever a half of that limit begins, so a page
+    is rendered again, with a new token, before the token it was first
+    rendered with expires. None when tokens never expire.
+    """
+    time_limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    if not time_limit:
+        return None
+    period = max(1, time_limit // 2)
+    return datetime.utcfromtimestamp(time.time() // period * period)
+
+
+def _csrf_state():
+    """Secret of the CSRF tokens of the session and when they were renewed."""
+    # Stores the secret of the session first, when the page is its first.
+    generate_csrf()
+    field = current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token")
+    return session[field], _csrf_renewed_at()
+
+
+def make_etag(*parts):
+    """Strong entity tag over the given parts, the requested path and the
+    CSRF tokens, as every page carries a form."""
+    data = "|".join(map(str, (request.full_path,) + _csrf_state() + parts))
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def _utc(local_time):
+    """Converts a naive local time, as shows are stored, to naive UTC."""
+    if local_time is None:
+        return None
+    return local_time.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _latest_start(*criteria):
+    """Start of the latest show that already began. A show moving from the
+    upcoming to the past section changes a page without any write."""
+    return (
+        db.select(db.func.max(Show._start_time))
+        .where(Show._start_time <= datetime.now(), *criteria)
+        .scalar_subquery()
+    )
+
+
+def conditional(validators):
+    """Decorator answering conditional GETs before the view runs.
+
+    Args:
+        validators: Called with the view arguments, returns an
+            (etag, last_modified) pair, where last_modified may be None, or
+            None when the view should just run, e.g. to render its 404.
+
+    A request whose If-None-Match or If-Modified-Since still matches gets an
+    empty 304, so neither the page queries nor the template run. Responses
+    carry the validators and must be revalidated before reuse. They vary
+    by cookie, as pages embed the CSRF token of their session, and their
+    validators change before that token expires.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if request.method != "GET" or session.get("_flashes"):
+                return view(**kwargs)
+            result = validators(**kwargs)
+            if result is None:
+                return view(**kwargs)
+
+            etag, last_modified = result
+            renewed_at = _csrf_renewed_at()
+            if last_modified is not None and renewed_at is not None:
+                last_modified = max(last_modified, renewed_at)
+            if is_resource_modified(
+                request.environ, etag=etag, last_modified=last_modified
+            ):
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            response.vary.add("Cookie")
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def venue_validators(venue_id):
+    """Validators of a venue page, which also shows its artists."""
+    artists_updated = (
+        db.select(db.func.max(Artist.updated_at))
+        .join(Show, Show.artist_id == Artist.id)
+        .where(Show.venue_id == Venue.id)
+        .scalar_subquery()
+    )
+    row = (
+        db.session.query(
+            Venue.updated_at,
+            artists_updated,
+            _latest_start(Show.venue_id == Venue.id),
+        )
+        .filter(Venue.id == venue_id)
+        .first()
+    )
+    if row is None:
+        return None
+    return _detail_validators(*row)
+
+
+def artist_validators(artist_id):
+    """Validators of an artist page, which also shows its venues."""
+    venues_updated = (
+        db.select(db.func.max(Venue.updated_at))
+        .join(Show, Show.venue_id == Venue.id)
+        .where(Show.artist_id == Artist.id)
+        .scalar_subquery()
+    )
+    row = (
+        db.session.query(
+            Artist.updated_at,
+            venues_updated,
+            _latest_start(Show.artist_id == Artist.id),
+        )
+        .filter(Artist.id == artist_id)
+        .first()
+    )
+    if row is None:
+        return None
+    return _detail_validators(*row)
+
+
+def _detail_validators(updated_at, related_updated_at, latest_start):
+    changes = [updated_at, related_updated_at, _utc(latest_start)]
+    last_modified = max(change for change in changes if change is not None)
+    return make_etag(*changes), last_modified
+
+
+def listing_validators(*models):
+    """Validators of a page listing the rows of the models.
+
+    The tag changes with the row counts, the latest update and the latest
+    show start, as listings show upcoming show counts. Deleted rows leave no
+    timestamp behind, so listings get no Last-Modified and are revalidated
+    with their entity tag only.
+    """
+
+    def validators(**kwargs):
+        aggregates = [
+            db.select(aggregate).scalar_subquery()
+            for model in models
+            for aggregate in (
+                db.func.count(model.id), db.func.max(model.updated_at))
+        ]
+        state = db.session.query(*aggregates, _latest_start()).one()
+        return make_etag(*state), None
+
+    return validators
@@ -21,3 +21,86 @@ SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI")
 SQLALCHEMY_TRACK_MODIFICATIONS = (
     os.environ.get("SQLALCHEMY_TRACK_MODIFICATIONS", False) == "true"
 )
+
+# Connection pool of each worker process, see dbpool.py. A worker holds up
+# to DB_POOL_SIZE + DB_MAX_OVERFLOW connections and waits DB_POOL_TIMEOUT
+# seconds for one before failing the request. Connections are replaced after
+# DB_POOL_RECYCLE seconds and checked before use when DB_POOL_PRE_PING is set.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true") == "true"
+
+# Waits for a pooled connection longer than this many seconds are logged.
+DB_POOL_SLOW_WAIT = float(os.environ.get("DB_POOL_SLOW_WAIT", 0.1))
+
+# Milliseconds after which PostgreSQL cancels a statement, 0 for no limit.
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", 0))
+
+# Set when connecting through PgBouncer in transaction pooling mode.
+DB_PGBOUNCER = os.environ.get("DB_PGBOUNCER", False) == "true"
+
+# Read replicas, comma separated database URIs. Views marked read-only in
+# app.py read from a random one. Users stay on the primary for
+# REPLICA_STICKY_SECONDS after they wrote, to see their own changes despite
+# replication lag, and a replica that fails is skipped for
+# REPLICA_RETRY_SECONDS.
+SQLALCHEMY_BINDS = {
+    f"replica{number}": uri
+    for number, uri in enumerate(
+        filter(None, os.environ.get("SQLALCHEMY_REPLICA_URIS", "").split(",")),
+        start=1,
+    )
+}
+REPLICA_BINDS = list(SQLALCHEMY_BINDS)
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 5))
+REPLICA_RETRY_SECONDS = int(os.environ.get("REPLICA_RETRY_SECONDS", 30))
+
+# Records the SQL statements of each request, see instrumentation.py. A
+# statement shape repeated SQL_N_PLUS_ONE_THRESHOLD times in one request is
+# logged as N+1 queries. SQL_DEBUG_HEADER adds an X-SQL-Stats header.
+SQL_INSTRUMENTATION = os.environ.get("SQL_INSTRUMENTATION", "true") == "true"
+SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", 5))
+SQL_SLOWEST_STATEMENTS = int(os.environ.get("SQL_SLOWEST_STATEMENTS", 5))
+SQL_DEBUG_HEADER = (
+    os.environ.get("SQL_DEBUG_HEADER", str(DEBUG).lower()) == "true")
+
+# Metrics served at /metrics. Set METRICS_DIR to a directory for /metrics to
+# add up the metrics of all live worker processes, each saving its own there
+# every METRICS_FLUSH_SECONDS. Files of exited processes are deleted when a
+# process starts.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 1))
+
+# Appends every request to REQUEST_RECORDING_PATH as a JSON line, to be
+# replayed with `flask replay`, see recording.py.
+REQUEST_RECORDING = os.environ.get("REQUEST_RECORDING", False) == "true"
+REQUEST_RECORDING_PATH = os.environ.get(
+    "REQUEST_RECORDING_PATH", os.path.join(basedir, "recorded_requests.jsonl"))
+
+# Database `flask benchmark` seeds and measures the routes against, see
+# benchmark.py. Its artists, venues and shows are deleted. Routes slower or
+# allocating more memory than BENCHMARK_THRESHOLD, a fraction of the saved
+# baseline, fail the benchmark.
+BENCHMARK_DATABASE_URI = os.environ.get("BENCHMARK_DATABASE_URI")
+BENCHMARK_BASELINE_PATH = os.environ.get(
+    "BENCHMARK_BASELINE_PATH",
+    os.path.join(basedir, "benchmark_baseline.json"),
+)
+BENCHMARK_THRESHOLD = float(os.environ.get("BENCHMARK_THRESHOLD", 0.25))
+
+# Default and maximum number of rows on paginated list pages.
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 20))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 100))
+
+# Default number of suggestions returned by the typeahead endpoints.
+TYPEAHEAD_LIMIT = int(os.environ.get("TYPEAHEAD_LIMIT", 10))
+
+# Rendered page cache: "null" (disabled), "memory" (per process LRU) or
+# "filesystem" (shared by all workers through PAGE_CACHE_DIR).
+PAGE_CACHE_BACKEND = os.environ.get("PAGE_CACHE_BACKEND", "null")
+PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 300))
+PAGE_CACHE_MAXSIZE = int(os.environ.get("PAGE_CACHE_MAXSIZE", 1024))
+PAGE_CACHE_DIR = os.environ.get(
+    "PAGE_CACHE_DIR", os.path.join(basedir, ".page_cache"))
@@ -0,0 +1,190 @@
+from sqlalchemy.engine import CreateEnginePlugin, make_url
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.dialects import plugins
+from sqlalchemy import event, exc
+
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Name of ConnectionSetup in the engine plugin registry.
+PLUGIN = "fyyur_connection_setup"
+
+
+class PoolStats:
+    """Counters of how long checkouts waited for a pooled connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool measuring the time spent getting a connection.
+
+    That includes waiting for a connection to be returned when the pool and
+    its overflow are exhausted, and opening overflow connections. Waits
+    longer than `slow_wait` seconds and timeouts are logged as warnings.
+    """
+
+    def __init__(self, creator, slow_wait=0.1, stats=None, **kwargs):
+        super().__init__(creator, **kwargs)
+        self.slow_wait = slow_wait
+        self.stats = stats or PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            logger.warning("Database pool exhausted: %s", self.status())
+            raise
+        waited = time.perf_counter() - start
+        self.stats.record(waited)
+        if waited > self.slow_wait:
+            logger.warning(
+                "Waited %.3fs for a database connection: %s",
+                waited, self.status())
+        return connection
+
+    def recreate(self):
+        # Keeps the counters when the pool is replaced, e.g. after a
+        # disconnect is detected.
+        pool = super().recreate()
+        pool.slow_wait = self.slow_wait
+        pool.stats = self.stats
+        return pool
+
+    def metrics(self):
+        """Current pool usage and the checkout wait counters."""
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.stats.checkouts,
+            "timeouts": self.stats.timeouts,
+            "wait_seconds": self.stats.wait_seconds,
+            "max_wait_seconds": self.stats.max_wait_seconds,
+        }
+
+
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+
+class ConnectionSetup(CreateEnginePlugin):
+    """Engine plugin configuring the connections of the app's engines.
+
+    Only engines created with the options of engine_options get it, not the
+    other engines of the process. SQLite connections enforce foreign keys,
+    so deletes cascade like on PostgreSQL. With the
+    transaction_statement_timeout engine argument, every PostgreSQL
+    transaction sets its statement timeout with SET LOCAL.
+    """
+
+    def __init__(self, url, kwargs):
+        super().__init__(url, kwargs)
+        self.statement_timeout = kwargs.pop(
+            "transaction_statement_timeout", None)
+
+    def engine_created(self, engine):
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", _enable_foreign_keys)
+        elif engine.dialect.name == "postgresql" and self.statement_timeout:
+            event.listen(engine, "begin", self._set_statement_timeout)
+
+    def _set_statement_timeout(self, connection):
+        connection.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {int(self.statement_timeout)}")
+
+
+plugins.register(PLUGIN, __name__, "ConnectionSetup")
+
+
+def engine_options(config):
+    """Builds SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings.
+
+    Servers get an InstrumentedQueuePool sized by DB_POOL_SIZE and
+    DB_MAX_OVERFLOW. Behind PgBouncer in transaction mode (DB_PGBOUNCER),
+    PgBouncer does the pooling, so the application keeps no connections
+    open, and no startup parameters are sent, which PgBouncer rejects. The
+    statement timeout is set per transaction instead, as a session setting
+    would leak to other clients of the server connection. SQLite keeps the
+    pools Flask-SQLAlchemy picks for it. Every engine gets ConnectionSetup.
+    """
+    options = {"plugins": [PLUGIN]}
+    uri = config["SQLALCHEMY_DATABASE_URI"]
+    if not uri or make_url(uri).get_backend_name() == "sqlite":
+        return options
+
+    options["pool_pre_ping"] = config["DB_POOL_PRE_PING"]
+    timeout = config["DB_STATEMENT_TIMEOUT"]
+    if config["DB_PGBOUNCER"]:
+        options["poolclass"] = NullPool
+        if timeout:
+            options["transaction_statement_timeout"] = timeout
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+            pool_recycle=config["DB_POOL_RECYCLE"],
+            pool_use_lifo=True,
+            slow_wait=config["DB_POOL_SLOW_WAIT"],
+        )
+        if timeout and make_url(uri).get_backend_name() == "postgresql":
+            options["connect_args"] = {
+                "options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def init_app(app):
+    """Configures the engines of the app from its DB_* settings.
+
+    Explicit SQLALCHEMY_ENGINE_OPTIONS take precedence. Call before
+    SQLAlchemy.init_app.
+    """
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_options(app.config),
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
+
+
+def pool_metrics(engine):
+    """Metrics of the engine pool, or None when it is not instrumented."""
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        return engine.pool.metrics()
+    return None
+
+
+def collect_metrics(registry, engine, bind):
+    """Sets the pool metrics of an engine in a metrics.Registry."""
+    pool = pool_metrics(engine)
+    if pool is None:
+        return
+    labels = {"bind": bind}
+    for state in ("checked_in", "checked_out", "overflow"):
+        registry.set(
+            "fyyur_db_pool_connections", dict(labels, state=state),
+            pool[state])
+    registry.set_total(
+        "fyyur_db_pool_checkouts_total", labels, pool["checkouts"])
+    registry.set_total(
+        "fyyur_db_pool_timeouts_total", labels, pool["timeouts"])
+    registry.set_total(
+        "fyyur_db_pool_wait_seconds_total", labels, pool["wait_seconds"])
@@ -0,0 +1,87 @@
+from model import db, Genre, GENRE_LINKS
+
+# Query string arguments the venue and artist listings can be narrowed by.
+FILTERS = ("genre", "state", "city")
+
+
+def filter_args(args):
+    """Filters given in a query string, empty ones left out."""
+    return {name: args[name] for name in FILTERS if args.get(name)}
+
+
+def filtered(query, model, filters, skip=None):
+    """Narrows a query over venues or artists to the ones matching filters.
+
+    A genre is looked up through the genre_id index of the link table, the
+    state and city through the columns of the model.
+
+    Args:
+        query: Query selecting from the model.
+        model: Venue or Artist.
+        filters: Dict as returned by filter_args().
+        skip: Name of a filter to leave out.
+    """
+    for name, value in filters.items():
+        if name == skip:
+            continue
+        if name == "genre":
+            table, owner = GENRE_LINKS[model]
+            query = query.filter(model.id.in_(
+                db.select(owner)
+                .join(Genre, Genre.id == table.c.genre_id)
+                .where(Genre.name == value)
+            ))
+        else:
+            query = query.filter(getattr(model, name) == value)
+    return query
+
+
+def counts(model, filters, limit):
+    """Counts of the venues or artists matching filters, by genre, state
+    and city.
+
+    Each facet is counted with the other filters applied only, so it lists
+    the values the selection can be switched to, e.g. the genres of venues
+    in NY while browsing the jazz venues of NY.
+
+    Args:
+        model: Venue or Artist.
+        filters: Dict as returned by filter_args().
+        limit: Maximum number of cities, the most common first.
+
+    Returns:
+        Dict of "genres", "states" and "cities" lists, most common first.
+    """
+    table, owner = GENRE_LINKS[model]
+    count = db.func.count().label("count")
+    genres = (
+        filtered(
+            db.session.query(Genre.name, count)
+            .select_from(table)
+            .join(Genre, Genre.id == table.c.genre_id)
+            .join(model, model.id == owner),
+            model, filters, skip="genre")
+        .group_by(Genre.name)
+        .order_by(count.desc(), Genre.name)
+    )
+    states = (
+        filtered(db.session.query(model.state, count), model, filters,
+                 skip="state")
+        .group_by(model.state)
+        .order_by(count.desc(), model.state)
+    )
+    cities = (
+        filtered(db.session.query(model.city, model.state, count), model,
+                 filters, skip="city")
+        .group_by(model.city, model.state)
+        .order_by(count.desc(), model.city, model.state)
+        .limit(limit)
+    )
+    return {
+        "genres": [{"name": name, "count": n} for name, n in genres],
+        "states": [{"state": state, "count": n} for state, n in states],
+        "cities": [
+            {"city": city, "state": state, "count": n}
+            for city, state, n in cities
+        ],
+    }
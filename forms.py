@@ -1,34 +1,21 @@
 from wtforms.validators import DataRequired, URL, Optional
+from model import SHOW_DURATION_DEFAULT
+from wtforms.widgets import HiddenInput
 from flask_wtf import FlaskForm
 from enums import Genre, State
 from datetime import datetime
 from wtforms import (
     StringField,
+    TextAreaField,
     SelectField,
     SelectMultipleField,
     DateTimeField,
     BooleanField,
+    IntegerField,
 )
 
-import re
-
-
-def is_valid_phone(number):
-    """Validate phone numbers like:
-    1234567890 - no space
-    123.456.7890 - dot separator
-    123-456-7890 - dash separator
-    123 456 7890 - space separator
-
-    Patterns:
-    000 = [0-9]{3}
-    0000 = [0-9]{4}
-    -.  = ?[-. ]
-
-    Note: (? = optional) - Learn more: https://regex101.com/
-    """
-    regex = re.compile("^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$")
-    return regex.match(number)
+import validation
+import schedule
 
 
 class ShowForm(FlaskForm):
@@ -36,9 +23,86 @@ class ShowForm(FlaskForm):
     All show page form fields and related validation rules.
     """
 
-    artist_id = SelectField("artist_id", validate_choice=False, choices=[])
-    venue_id = SelectField("venue_id", validate_choice=False, choices=[])
+    # Filled in by the typeahead lookups of the form page.
+    artist_id = IntegerField(
+        "artist_id",
+        validators=[DataRequired(message="Choose an artist from the list.")],
+        widget=HiddenInput(),
+    )
+    venue_id = IntegerField(
+        "venue_id",
+        validators=[DataRequired(message="Choose a venue from the list.")],
+        widget=HiddenInput(),
+    )
     start_time = DateTimeField("start_time", default=datetime.today())
+    # In minutes.
+    duration = IntegerField("duration", default=SHOW_DURATION_DEFAULT)
+
+    def validate(self):
+        """Custom validate method for the duration, shared with bulk imports
+        through validation.SHOW, and for bookings the venue or the artist
+        already has at that time"""
+        rv = FlaskForm.validate(self)
+        if not rv or not validation.SHOW.validate_form(self):
+            return False
+        booked = schedule.conflicts(
+            self.venue_id.data,
+            self.artist_id.data,
+            self.start_time.data,
+            self.duration.data,
+        )
+        for name, message in booked.items():
+            getattr(self, name).errors.append(message)
+        return not booked
+
+
+class ScheduleForm(FlaskForm):
+    """
+    Batch form of the shows of an artist: the dates of a tour at several
+    venues and/or a residency recurring at one venue.
+    """
+
+    artist_id = IntegerField(
+        "artist_id",
+        validators=[DataRequired(message="Choose an artist from the list.")],
+        widget=HiddenInput(),
+    )
+    # In minutes, the same for every show.
+    duration = IntegerField("duration", default=SHOW_DURATION_DEFAULT)
+    # One show per line: venue id, start time.
+    dates = TextAreaField("dates", validators=[Optional()])
+    # The residency, repeating from start_time by an RFC 5545 rule.
+    venue_id = IntegerField(
+        "venue_id", validators=[Optional()], widget=HiddenInput())
+    start_time = DateTimeField("start_time", validators=[Optional()])
+    rule = StringField("rule", validators=[Optional()])
+
+    def validate(self):
+        """Custom validate method checking every show of the batch together
+        through schedule.validate_batch(), whose errors are form errors. The
+        shows to insert are left in `rows`"""
+        rv = FlaskForm.validate(self)
+        if not rv:
+            return False
+        items = schedule.tour_items(self.dates.data or "")
+        if self.rule.data:
+            if self.venue_id.data is None or self.start_time.data is None:
+                self.rule.errors.append(
+                    "A residency needs a venue and a first start time.")
+                return False
+            try:
+                items += schedule.recurrence_items(
+                    self.rule.data, self.venue_id.data, self.start_time.data)
+            except ValueError as error:
+                self.rule.errors.append(str(error))
+                return False
+        if not items:
+            self.dates.errors.append("Give the dates of a tour or a residency.")
+            return False
+        self.rows, errors = schedule.validate_batch(
+            self.artist_id.data, self.duration.data, items)
+        self.form_errors.extend(errors)
+        return not errors
 
 
 class VenueForm(FlaskForm):
@@ -72,20 +136,12 @@ class VenueForm(FlaskForm):
     seeking_description = StringField("seeking_description")
 
     def validate(self):
-        """Custom validate method for phone, genre and state"""
+        """Custom validate method for phone, genre and state, shared with
+        bulk imports through validation.VENUE"""
         rv = FlaskForm.validate(self)
         if not rv:
             return False
-        if not is_valid_phone(self.phone.data):
-            self.phone.errors.append("Invalid phone.")
-            return False
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
-            self.genres.errors.append("Invalid genres.")
-            return False
-        if self.state.data not in dict(State.choices()).keys():
-            self.state.errors.append("Invalid state.")
-            return False
-        return True
+        return validation.VENUE.validate_form(self)
 
 
 class ArtistForm(FlaskForm):
@@ -118,17 +174,9 @@ class ArtistForm(FlaskForm):
     seeking_description = StringField("seeking_description")
 
     def validate(self):
-        """Custom validate method for phone, genre and state"""
+        """Custom validate method for phone, genre and state, shared with
+        bulk imports through validation.ARTIST"""
         rv = FlaskForm.validate(self)
         if not rv:
             return False
-        if not is_valid_phone(self.phone.data):
-            self.phone.errors.append("Invalid phone.")
-            return False
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
-            self.genres.errors.append("Invalid genres.")
-            return False
-        if self.state.data not in dict(State.choices()).keys():
-            self.state.errors.append("Invalid state.")
-            return False
-        return True
+        return validation.ARTIST.validate_form(self)
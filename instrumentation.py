@@ -0,0 +1,151 @@
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
+
+import threading
+import heapq
+import time
+import re
+
+# Placeholder lists of expanding IN parameters, whose length varies.
+_PARAMETER_LIST = re.compile(
+    r"\(\s*(?:%\(\w+\)s|\?)(?:\s*,\s*(?:%\(\w+\)s|\?))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """Statement with the variable parts collapsed. Statements sharing a
+    shape differ only in their parameters."""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    return _PARAMETER_LIST.sub("(...)", shape)
+
+
+class EndpointStats:
+    """SQL totals of the requests an endpoint served."""
+
+    def __init__(self, keep_slowest):
+        self.keep_slowest = keep_slowest
+        self.requests = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.max_queries = 0
+        self.n_plus_one_requests = 0
+        self._slowest = []
+
+    def add(self, queries, n_plus_one):
+        self.requests += 1
+        self.queries += len(queries)
+        self.db_seconds += sum(seconds for _, seconds in queries)
+        self.max_queries = max(self.max_queries, len(queries))
+        self.n_plus_one_requests += bool(n_plus_one)
+        for statement, seconds in queries:
+            entry = (seconds, statement_shape(statement))
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "queries_per_request": self.queries / self.requests,
+            "max_queries": self.max_queries,
+            "db_seconds": self.db_seconds,
+            "n_plus_one_requests": self.n_plus_one_requests,
+            "slowest": [
+                {"seconds": seconds, "statement": statement}
+                for seconds, statement in sorted(self._slowest, reverse=True)
+            ],
+        }
+
+
+class SQLInstrumentation:
+    """Records the SQL statements each request runs.
+
+    Per endpoint, it keeps the query count, the time spent in the database
+    and the slowest statements. Statements of the same shape repeated at
+    least SQL_N_PLUS_ONE_THRESHOLD times in a request, typically lazy loads
+    in a loop, are logged as N+1 queries. With SQL_DEBUG_HEADER, responses
+    carry an X-SQL-Stats header, and the totals are served as JSON at
+    /metrics/sql.
+    """
+
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config["SQL_INSTRUMENTATION"]:
+            return
+        # On the Engine class, so replica engines are recorded as well.
+        event.listen(Engine, "before_cursor_execute", self._before_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule("/metrics/sql", "sql_metrics", self.metrics)
+
+    def _start(self):
+        g.sql_queries = []
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        context._sql_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        if has_request_context() and g.get("sql_queries") is not None:
+            g.sql_queries.append(
+                (statement, time.perf_counter() - context._sql_start))
+
+    def n_plus_one(self, queries):
+        """Shapes of the statements repeated often enough to be N+1
+        queries, with their repeat counts."""
+        counts = {}
+        for statement, _ in queries:
+            shape = statement_shape(statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        threshold = current_app.config["SQL_N_PLUS_ONE_THRESHOLD"]
+        return {
+            shape: count for shape, count in counts.items()
+            if count >= threshold
+        }
+
+    def _finish(self, response):
+        queries = g.get("sql_queries")
+        if queries is None or request.endpoint == "sql_metrics":
+            return response
+        repeated = self.n_plus_one(queries)
+        seconds = sum(seconds for _, seconds in queries)
+        endpoint = request.endpoint or "<unmatched>"
+
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(
+                    current_app.config["SQL_SLOWEST_STATEMENTS"])
+            stats.add(queries, repeated)
+
+        current_app.logger.debug(
+            "%s %s: %d queries in %.1fms", request.method, request.path,
+            len(queries), seconds * 1000)
+        for shape, count in repeated.items():
+            current_app.logger.warning(
+                "N+1 queries in %s %s, %d times: %s", request.method,
+                request.path, count, shape)
+        if current_app.config["SQL_DEBUG_HEADER"]:
+            response.headers["X-SQL-Stats"] = (
+                f"queries={len(queries)}; time_ms={seconds * 1000:.2f}; "
+                f"n_plus_one={len(repeated)}")
+        return response
+
+    def metrics(self):
+        """SQL totals per endpoint of this process, as JSON."""
+        with self._lock:
+            endpoints = {
+                endpoint: stats.to_dict()
+                for endpoint, stats in sorted(self.endpoints.items())
+            }
+        return jsonify(endpoints=endpoints)
@@ -0,0 +1,284 @@
+from flask import (
+    before_render_template,
+    current_app,
+    g,
+    request,
+    template_rendered,
+)
+from bisect import bisect_left
+
+import threading
+import json
+import time
+import os
+
+# Upper bounds in seconds of the histogram buckets, +Inf is implied.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    "fyyur_requests_total": ("counter", "Requests served."),
+    "fyyur_request_duration_seconds": (
+        "histogram", "Time to build the response of a request."),
+    "fyyur_request_db_seconds": (
+        "histogram", "Time a request spent running SQL statements."),
+    "fyyur_template_render_seconds": (
+        "histogram", "Time to render a template."),
+    "fyyur_db_pool_connections": (
+        "gauge", "Connections of the database pool by state."),
+    "fyyur_db_pool_checkouts_total": (
+        "counter", "Connections taken from the database pool."),
+    "fyyur_db_pool_timeouts_total": (
+        "counter", "Checkouts that timed out waiting for a connection."),
+    "fyyur_db_pool_wait_seconds_total": (
+        "counter", "Time spent waiting for database connections."),
+}
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+class Registry:
+    """Counters, gauges and histograms of one process.
+
+    Samples are keyed by metric name and labels. Snapshots are plain dicts,
+    so the registries of several processes can be saved and merged.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, amount=1):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def set_total(self, name, labels, value):
+        """Sets a counter kept elsewhere, e.g. by the database pool."""
+        with self._lock:
+            self.counters[_key(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        key = _key(name, labels)
+        with self._lock:
+            # Counts per bucket, then the sum and count of all values.
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 3)
+            histogram[bisect_left(BUCKETS, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {
+                    key: list(values)
+                    for key, values in self.histograms.items()
+                },
+            }
+
+
+def merge(snapshots):
+    """Sums the snapshots of several processes into one."""
+    merged = {"counters": {}, "gauges": {}, "histograms": {}}
+    for snapshot in snapshots:
+        for kind in ("counters", "gauges"):
+            for key, value in snapshot[kind].items():
+                merged[kind][key] = merged[kind].get(key, 0) + value
+        for key, values in snapshot["histograms"].items():
+            total = merged["histograms"].get(key)
+            if total is None:
+                merged["histograms"][key] = list(values)
+            else:
+                merged["histograms"][key] = [
+                    a + b for a, b in zip(total, values)]
+    return merged
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _sample(name, labels, value):
+    if labels:
+        text = ",".join(f'{label}="{_escape(v)}"' for label, v in labels)
+        return f"{name}{{{text}}} {value}"
+    return f"{name} {value}"
+
+
+def render(snapshot):
+    """Formats a snapshot in the Prometheus text exposition format."""
+    families = {}
+    for kind in ("counters", "gauges"):
+        for key, value in snapshot[kind].items():
+            name, labels = json.loads(key)
+            families.setdefault(name, []).append(_sample(name, labels, value))
+    for key, values in snapshot["histograms"].items():
+        name, labels = json.loads(key)
+        lines = families.setdefault(name, [])
+        cumulative = 0
+        bounds = [str(bound) for bound in BUCKETS] + ["+Inf"]
+        for bound, count in zip(bounds, values):
+            cumulative += count
+            lines.append(_sample(
+                f"{name}_bucket", labels + [["le", bound]], cumulative))
+        lines.append(_sample(f"{name}_sum", labels, values[-2]))
+        lines.append(_sample(f"{name}_count", labels, values[-1]))
+
+    output = []
+    for name in sorted(families):
+        type_, description = DESCRIPTIONS.get(name, ("untyped", name))
+        output.append(f"# HELP {name} {description}")
+        output.append(f"# TYPE {name} {type_}")
+        output.extend(families[name])
+    return "\n".join(output) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    """Request, template, database and pool metrics served at /metrics.
+
+    With METRICS_DIR set, every process saves its registry there at most
+    every METRICS_FLUSH_SECONDS, and /metrics adds up the registries of all
+    live processes, so every gunicorn worker reports the totals. Registries
+    of processes that exited, e.g. of an earlier run, are left out and
+    deleted whenever a process starts. Database time comes from the SQL
+    instrumentation.
+    """
+
+    def __init__(self, app=None):
+        self.registry = Registry()
+        self.collectors = []
+        self._flushed = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config["METRICS_DIR"]
+        self.flush_seconds = app.config["METRICS_FLUSH_SECONDS"]
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._delete_stale()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        app.add_url_rule("/metrics", "metrics", self.view)
+
+    def add_collector(self, collector):
+        """Adds a function called with the registry before the metrics are
+        saved or served, to set gauges and counters kept elsewhere. Can be
+        used as a decorator."""
+        self.collectors.append(collector)
+        return collector
+
+    def _start(self):
+        g.metrics_start = time.perf_counter()
+
+    def _finish(self, response):
+        start = g.pop("metrics_start", None)
+        if start is None or request.endpoint == "metrics":
+            return response
+        endpoint = request.endpoint or "<unmatched>"
+        labels = {"endpoint": endpoint, "method": request.method}
+        self.registry.observe(
+            "fyyur_request_duration_seconds", labels,
+            time.perf_counter() - start)
+        self.registry.inc(
+            "fyyur_requests_total",
+            dict(labels, status=str(response.status_code)))
+        queries = g.get("sql_queries")
+        if queries is not None:
+            self.registry.observe(
+                "fyyur_request_db_seconds", {"endpoint": endpoint},
+                sum(seconds for _, seconds in queries))
+        if self.directory and time.monotonic() - self._flushed > (
+            self.flush_seconds
+        ):
+            self.flush()
+        return response
+
+    def _render_started(self, sender, template, context, **extra):
+        g.setdefault("metrics_renders", []).append(time.perf_counter())
+
+    def _render_finished(self, sender, template, context, **extra):
+        starts = g.get("metrics_renders")
+        if starts:
+            self.registry.observe(
+                "fyyur_template_render_seconds",
+                {"template": template.name},
+                time.perf_counter() - starts.pop())
+
+    def _collect(self):
+        for collector in self.collectors:
+            collector(self.registry)
+
+    def _saved(self):
+        """Pids and entries of the files saved by processes in METRICS_DIR,
+        partially written ones included."""
+        for entry in os.scandir(self.directory):
+            pid = entry.name.partition(".")[0]
+            if pid.isdigit():
+                yield int(pid), entry
+
+    def _delete_stale(self):
+        """Deletes the registries saved by processes that exited."""
+        for pid, entry in self._saved():
+            if not _alive(pid):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def flush(self):
+        """Saves the registry of this process to METRICS_DIR."""
+        self._collect()
+        self._flushed = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.registry.snapshot(), file)
+        os.replace(temp_path, path)
+
+    def snapshot(self):
+        """Metrics of this process, merged with the ones saved by the other
+        live processes when METRICS_DIR is set."""
+        self._collect()
+        snapshots = [self.registry.snapshot()]
+        if self.directory:
+            for pid, entry in self._saved():
+                if (not entry.name.endswith(".json") or pid == os.getpid()
+                        or not _alive(pid)):
+                    continue
+                try:
+                    with open(entry.path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        return merge(snapshots)
+
+    def view(self):
+        return current_app.response_class(
+            render(self.snapshot()),
+            mimetype="text/plain; version=0.0.4",
+        )
@@ -32,6 +32,14 @@ target_metadata = current_app.extensions['migrate'].db.metadata
 # ... etc.
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Keeps autogenerate from dropping the hand written trigram search
+    indexes, which depend on pg_trgm and are not declared on the models."""
+    if type_ == 'index' and reflected and name.endswith('_trgm'):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -78,6 +86,10 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
+            # Some migrations build indexes concurrently, outside of any
+            # transaction, so run every migration in its own transaction.
+            transaction_per_migration=True,
             **current_app.extensions['migrate'].configure_args
         )
 
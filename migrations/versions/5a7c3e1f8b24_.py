@@ -0,0 +1,39 @@
+"""add artist and venue name prefix indexes for typeahead
+
+Revision ID: 5a7c3e1f8b24
+Revises: d91c3f7a5e28
+Create Date: 2026-10-17 14:26:51.380417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7c3e1f8b24'
+down_revision = 'd91c3f7a5e28'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Artist', 'Venue']
+
+
+def upgrade():
+    # Expressions must match search.name_key(). Bytewise ("C") ordering lets
+    # the index serve both the prefix LIKE and the ORDER BY of typeahead.
+    key = 'lower(name) COLLATE "C"'
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(
+                f'ix_{table}_name_prefix', table, [sa.text(key), 'id'],
+                unique=False, postgresql_concurrently=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in reversed(TABLES):
+            op.drop_index(
+                f'ix_{table}_name_prefix', table_name=table,
+                postgresql_concurrently=True
+            )
@@ -0,0 +1,57 @@
+"""add full-text and trigram search indexes for artists and venues
+
+Revision ID: 7f4b0c2d9e61
+Revises: 3c5a1e9d2b7f
+Create Date: 2026-10-17 10:02:17.553920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f4b0c2d9e61'
+down_revision = '3c5a1e9d2b7f'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Venue', 'Artist']
+
+
+def upgrade():
+    # array_to_string is only STABLE, index expressions must be IMMUTABLE.
+    op.execute(
+        "CREATE OR REPLACE FUNCTION immutable_array_to_string(text[], text) "
+        "RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE "
+        "AS 'SELECT array_to_string($1, $2)'"
+    )
+    for table in TABLES:
+        op.execute(
+            f'CREATE INDEX "ix_{table}_search" ON "{table}" USING gin '
+            f"(to_tsvector('simple', name || ' ' || city || ' ' || "
+            f"immutable_array_to_string(genres::text[], ' ')))"
+        )
+
+    # Trigram indexes serve the substring (ILIKE) part of the search. The
+    # search works without them, so skip them where pg_trgm is unavailable.
+    available = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar()
+    if not available:
+        print("pg_trgm is not available, skipping trigram indexes.")
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        op.execute(
+            f'CREATE INDEX "ix_{table}_name_trgm" ON "{table}" '
+            f'USING gin (name gin_trgm_ops)'
+        )
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f'DROP INDEX IF EXISTS "ix_{table}_name_trgm"')
+        op.execute(f'DROP INDEX IF EXISTS "ix_{table}_search"')
+    op.execute(
+        'DROP FUNCTION IF EXISTS immutable_array_to_string(text[], text)')
+
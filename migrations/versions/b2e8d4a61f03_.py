@@ -0,0 +1,41 @@
+"""add show and venue access path indexes
+
+Revision ID: b2e8d4a61f03
+Revises: 7f4b0c2d9e61
+Create Date: 2026-10-17 10:48:05.207731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e8d4a61f03'
+down_revision = '7f4b0c2d9e61'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', '_start_time']),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', '_start_time']),
+    ('ix_Show_start_time', 'Show', ['_start_time']),
+    ('ix_Venue_city_state', 'Venue', ['city', 'state']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY does not lock out writes to live tables, but
+    # cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,99 @@
+"""move genres of artists and venues into a genre table
+
+Revision ID: c4e9a2b7d610
+Revises: 5a7c3e1f8b24
+Create Date: 2026-10-17 16:08:42.915370
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e9a2b7d610'
+down_revision = '5a7c3e1f8b24'
+branch_labels = None
+depends_on = None
+
+# Values of enums.Genre when the table was created.
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul',
+    'Other',
+]
+
+# Owner table of each link table and the column pointing to it.
+LINKS = {'VenueGenre': ('Venue', 'venue_id'),
+         'ArtistGenre': ('Artist', 'artist_id')}
+
+
+def _search_index(table, document):
+    op.execute(f'DROP INDEX IF EXISTS "ix_{table}_search"')
+    op.execute(
+        f'CREATE INDEX "ix_{table}_search" ON "{table}" USING gin '
+        f"(to_tsvector('simple', {document}))"
+    )
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genre, [{'name': name} for name in GENRES])
+
+    for link, (table, column) in LINKS.items():
+        op.create_table(link,
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([column], [f'{table}.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint(column, 'genre_id')
+        )
+        op.create_index(
+            f'ix_{link}_genre_id_{column}', link, ['genre_id', column],
+            unique=False
+        )
+        # Names outside of the genre table are dropped, like the forms never
+        # accepted them.
+        op.execute(
+            f'INSERT INTO "{link}" ({column}, genre_id) '
+            f'SELECT DISTINCT t.id, g.id FROM "{table}" t '
+            f'CROSS JOIN unnest(t.genres) AS genre(name) '
+            f'JOIN "Genre" g ON g.name = genre.name'
+        )
+        # The search documents covered the genre arrays.
+        _search_index(table, "name || ' ' || city")
+        op.drop_column(table, 'genres')
+
+    op.execute(
+        'DROP FUNCTION IF EXISTS immutable_array_to_string(text[], text)')
+
+
+def downgrade():
+    op.execute(
+        "CREATE OR REPLACE FUNCTION immutable_array_to_string(text[], text) "
+        "RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE "
+        "AS 'SELECT array_to_string($1, $2)'"
+    )
+    for link, (table, column) in LINKS.items():
+        op.add_column(table, sa.Column(
+            'genres', sa.ARRAY(sa.String(length=500)), nullable=True))
+        op.execute(
+            f'UPDATE "{table}" t SET genres = ARRAY('
+            f'SELECT g.name FROM "{link}" l '
+            f'JOIN "Genre" g ON g.id = l.genre_id '
+            f'WHERE l.{column} = t.id ORDER BY g.name)'
+        )
+        _search_index(
+            table,
+            "name || ' ' || city || ' ' || "
+            "immutable_array_to_string(genres::text[], ' ')"
+        )
+        op.alter_column(table, 'genres', nullable=False)
+        op.drop_index(f'ix_{link}_genre_id_{column}', table_name=link)
+        op.drop_table(link)
+    op.drop_table('Genre')
@@ -0,0 +1,47 @@
+"""add show durations and keep venues and artists from double booking
+
+Revision ID: d81f5a3c2e47
+Revises: c4e9a2b7d610
+Create Date: 2026-10-17 19:42:16.208531
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f5a3c2e47'
+down_revision = 'c4e9a2b7d610'
+branch_labels = None
+depends_on = None
+
+# Longest show in minutes when the constraints were created.
+MAX_DURATION = 24 * 60
+
+BOOKINGS = {'ex_Show_venue_booking': 'venue_id',
+            'ex_Show_artist_booking': 'artist_id'}
+
+
+def upgrade():
+    op.add_column('Show', sa.Column(
+        'duration', sa.Integer(), server_default='120', nullable=False))
+    op.create_check_constraint(
+        'ck_Show_duration', 'Show',
+        f'duration > 0 AND duration <= {MAX_DURATION}')
+
+    for name, column in BOOKINGS.items():
+        # Fails on shows overlapping already, which need rescheduling first.
+        # One element ranges stand in for the btree_gist = on integers.
+        op.execute(
+            f'ALTER TABLE "Show" ADD CONSTRAINT "{name}" EXCLUDE USING '
+            f"gist (int4range({column}, {column}, '[]') WITH =, "
+            f"tsrange(_start_time, "
+            f"_start_time + duration * interval '1 minute') WITH &&)"
+        )
+
+
+def downgrade():
+    for name in BOOKINGS:
+        op.execute(f'ALTER TABLE "Show" DROP CONSTRAINT "{name}"')
+    op.drop_constraint('ck_Show_duration', 'Show', type_='check')
+    op.drop_column('Show', 'duration')
@@ -0,0 +1,37 @@
+"""add updated_at to artists, venues and shows
+
+Revision ID: d91c3f7a5e28
+Revises: b2e8d4a61f03
+Create Date: 2026-10-17 11:36:52.840117
+
+"""
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91c3f7a5e28'
+down_revision = 'b2e8d4a61f03'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Artist', 'Venue', 'Show']
+
+
+def upgrade():
+    now = datetime.utcnow()
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(
+            sa.table(table, sa.column('updated_at')).update().values(updated_at=now)
+        )
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                'updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
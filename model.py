@@ -1,15 +1,83 @@
+from sqlalchemy.orm import (
+    joinedload,
+    load_only,
+    query_expression,
+    raiseload,
+    selectinload,
+)
 from sqlalchemy.ext.hybrid import hybrid_property
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import event, inspect
+from routing import RoutingSQLAlchemy
+from datetime import datetime, timedelta
 
+import enums
 
-db = SQLAlchemy()
+
+db = RoutingSQLAlchemy()
+
+
+class Genre(db.Model):
+    """Music genre of venues and artists, one row per member of enums.Genre.
+
+    Venues and artists are linked to their genres through the VenueGenre and
+    ArtistGenre tables, indexed by genre, so filtering by genre is an index
+    lookup instead of a scan of every row.
+    """
+
+    __tablename__ = "Genre"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, names):
+        """Genres of the names, in one query. Unknown names are ignored,
+        validation only lets the names of enums.Genre through."""
+        if not names:
+            return []
+        with db.session.no_autoflush:
+            return cls.query.filter(cls.name.in_(names)).order_by(
+                cls.name).all()
+
+    def __repr__(self):
+        return f"<Genre {self.id}, {self.name}>"
+
+
+@event.listens_for(Genre.__table__, "after_create")
+def insert_genres(table, connection, **kwargs):
+    """Fills the genre table made by create_all, the migration fills it
+    otherwise."""
+    connection.execute(
+        table.insert(), [{"name": genre.value} for genre in enums.Genre])
+
+
+# The primary keys serve the genres of a venue or artist, the genre_id
+# indexes the venues or artists of a genre.
+venue_genres = db.Table(
+    "VenueGenre",
+    db.Column("venue_id", db.Integer,
+              db.ForeignKey("Venue.id", ondelete="CASCADE"),
+              primary_key=True),
+    db.Column("genre_id", db.Integer, db.ForeignKey("Genre.id"),
+              primary_key=True),
+    db.Index("ix_VenueGenre_genre_id_venue_id", "genre_id", "venue_id"),
+)
+artist_genres = db.Table(
+    "ArtistGenre",
+    db.Column("artist_id", db.Integer,
+              db.ForeignKey("Artist.id", ondelete="CASCADE"),
+              primary_key=True),
+    db.Column("genre_id", db.Integer, db.ForeignKey("Genre.id"),
+              primary_key=True),
+    db.Index("ix_ArtistGenre_genre_id_artist_id", "genre_id", "artist_id"),
+)
 
 
 class Venue(db.Model):
     """Venue data model connected to artist model through Show model"""
 
     __tablename__ = "Venue"
+    __table_args__ = (db.Index("ix_Venue_city_state", "city", "state"),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -17,32 +85,75 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(500)), nullable=False)
     facebook_link = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(500))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
-    shows = db.relationship(
-        "Show", back_populates="venue", cascade="all, delete", lazy="joined"
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow,
+        onupdate=datetime.utcnow
     )
+    shows = db.relationship(
+        "Show", back_populates="venue", cascade="all, delete")
+    _genres = db.relationship(
+        Genre, secondary=venue_genres, order_by=Genre.name)
+
+    @property
+    def genres(self):
+        """Names of the genres, as the forms and templates use them."""
+        return [genre.name for genre in self._genres]
+
+    @genres.setter
+    def genres(self, names):
+        genres = Genre.named(names)
+        if genres != self._genres:
+            self._genres = genres
+            # The row itself may be unchanged, its pages are not.
+            self.updated_at = datetime.utcnow()
 
     @hybrid_property
     def upcoming_shows(self):
         return [show for show in self.shows if show._start_time > datetime.now()]
 
+    @upcoming_shows.expression
+    def upcoming_shows(cls):
+        return cls.shows.any(Show._start_time > datetime.now())
+
     @hybrid_property
     def past_shows(self):
         return [show for show in self.shows if show._start_time < datetime.now()]
 
+    @past_shows.expression
+    def past_shows(cls):
+        return cls.shows.any(Show._start_time < datetime.now())
+
     @hybrid_property
     def upcoming_shows_count(self):
         return len(self.upcoming_shows)
 
+    @upcoming_shows_count.expression
+    def upcoming_shows_count(cls):
+        return (
+            db.select(db.func.count(Show.id))
+            .where(Show.venue_id == cls.id, Show._start_time > datetime.now())
+            .scalar_subquery()
+            .label("upcoming_shows_count")
+        )
+
     @hybrid_property
     def past_shows_count(self):
         return len(self.past_shows)
 
+    @past_shows_count.expression
+    def past_shows_count(cls):
+        return (
+            db.select(db.func.count(Show.id))
+            .where(Show.venue_id == cls.id, Show._start_time < datetime.now())
+            .scalar_subquery()
+            .label("past_shows_count")
+        )
+
     def __repr__(self):
         return f"<Venue {self.id}, {self.name}>"
 
@@ -51,63 +162,223 @@ class Artist(db.Model):
     """Artist data model connected to venue model through Show model"""
 
     __tablename__ = "Artist"
+    __table_args__ = (db.Index("ix_Artist_name_id", "name", "id"),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(500)), nullable=False)
     facebook_link = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(500))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
-    shows = db.relationship(
-        "Show", back_populates="artist", cascade="all, delete", lazy="joined"
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow,
+        onupdate=datetime.utcnow
     )
+    shows = db.relationship(
+        "Show", back_populates="artist", cascade="all, delete")
+    _genres = db.relationship(
+        Genre, secondary=artist_genres, order_by=Genre.name)
+
+    @property
+    def genres(self):
+        """Names of the genres, as the forms and templates use them."""
+        return [genre.name for genre in self._genres]
+
+    @genres.setter
+    def genres(self, names):
+        genres = Genre.named(names)
+        if genres != self._genres:
+            self._genres = genres
+            # The row itself may be unchanged, its pages are not.
+            self.updated_at = datetime.utcnow()
 
     @hybrid_property
     def upcoming_shows(self):
         return [show for show in self.shows if show._start_time > datetime.now()]
 
+    @upcoming_shows.expression
+    def upcoming_shows(cls):
+        return cls.shows.any(Show._start_time > datetime.now())
+
     @hybrid_property
     def past_shows(self):
         return [show for show in self.shows if show._start_time < datetime.now()]
 
+    @past_shows.expression
+    def past_shows(cls):
+        return cls.shows.any(Show._start_time < datetime.now())
+
     @hybrid_property
     def upcoming_shows_count(self):
         return len(self.upcoming_shows)
 
+    @upcoming_shows_count.expression
+    def upcoming_shows_count(cls):
+        return (
+            db.select(db.func.count(Show.id))
+            .where(Show.artist_id == cls.id, Show._start_time > datetime.now())
+            .scalar_subquery()
+            .label("upcoming_shows_count")
+        )
+
     @hybrid_property
     def past_shows_count(self):
         return len(self.past_shows)
 
+    @past_shows_count.expression
+    def past_shows_count(cls):
+        return (
+            db.select(db.func.count(Show.id))
+            .where(Show.artist_id == cls.id, Show._start_time < datetime.now())
+            .scalar_subquery()
+            .label("past_shows_count")
+        )
+
     def __repr__(self):
         return f"<Artist {self.id}, {self.name}>"
 
 
+# Length of a show in minutes, when not given, and the longest one allowed.
+# The bound keeps the shows overlapping a time within a window of the start
+# time indexes, see schedule.conflicts().
+SHOW_DURATION_DEFAULT = 120
+SHOW_DURATION_MAX = 24 * 60
+
+
 class Show(db.Model):
     """Connecting model for Artist and Venue models"""
 
     __tablename__ = "Show"
+    __table_args__ = (
+        db.Index("ix_Show_venue_id_start_time", "venue_id", "_start_time"),
+        db.Index("ix_Show_artist_id_start_time", "artist_id", "_start_time"),
+        db.Index("ix_Show_start_time", "_start_time"),
+        db.CheckConstraint(
+            f"duration > 0 AND duration <= {SHOW_DURATION_MAX}",
+            name="ck_Show_duration",
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey(
         "Artist.id"), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
     _start_time = db.Column(db.DateTime, nullable=False)
+    # In minutes.
+    duration = db.Column(
+        db.Integer, nullable=False, default=SHOW_DURATION_DEFAULT,
+        server_default=str(SHOW_DURATION_DEFAULT)
+    )
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
     artist = db.relationship("Artist", back_populates="shows")
     venue = db.relationship("Venue", back_populates="shows")
+    # Start of the calendar period of the show, when loaded with
+    # with_expression(Show.period, schedule.period_start(...)).
+    period = query_expression()
 
     @property
     def start_time(self):
-        return self._start_time.strftime("%Y-%m-%d %H:%M:%S")
+        return self._start_time
 
     @start_time.setter
     def start_time(self, value):
         self._start_time = value
 
+    @property
+    def end_time(self):
+        return self._start_time + timedelta(minutes=self.duration)
+
     def __repr__(self):
         return f"<Show {self.id}, Artist {self.artist_id}, \
             Venue {self.venue_id}>"
+
+
+@event.listens_for(db.session, "before_flush")
+def touch_show_parents(session, flush_context, instances):
+    """Bumps updated_at of the artists and venues whose shows are created,
+    changed or deleted, as their pages change with their shows."""
+    artist_ids, venue_ids = set(), set()
+    for show in session.new | session.dirty | session.deleted:
+        if not isinstance(show, Show):
+            continue
+        state = inspect(show)
+        for ids, attr in ((artist_ids, "artist_id"), (venue_ids, "venue_id")):
+            history = state.attrs[attr].history
+            ids.update(history.sum())
+    now = datetime.utcnow()
+    for model, ids in ((Artist, artist_ids), (Venue, venue_ids)):
+        ids.discard(None)
+        if ids:
+            session.execute(
+                db.update(model)
+                .where(model.id.in_(ids))
+                .values(updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+
+
+# Genre links of venues and artists, with the column pointing to their owner.
+GENRE_LINKS = {
+    Venue: (venue_genres, venue_genres.c.venue_id),
+    Artist: (artist_genres, artist_genres.c.artist_id),
+}
+
+
+# Relationship loading strategies per kind of page. Relationships are loaded
+# lazily by default, every route picks the profile matching what it renders:
+#   list     - no shows, only the columns listing tiles need
+#   detail   - shows with their artist/venue and the genres in a fixed
+#              number of queries
+#   delete   - shows and genre links in one query each, so the delete
+#              cascade can walk them
+LOADING_PROFILES = {
+    Venue: {
+        "list": (
+            raiseload(Venue.shows),
+            load_only(Venue.id, Venue.name, Venue.city,
+                      Venue.state, Venue.image_link),
+        ),
+        "detail": (
+            selectinload(Venue.shows).joinedload(Show.artist),
+            selectinload(Venue._genres),
+        ),
+        "delete": (selectinload(Venue.shows), selectinload(Venue._genres)),
+    },
+    Artist: {
+        "list": (
+            raiseload(Artist.shows),
+            load_only(Artist.id, Artist.name, Artist.city,
+                      Artist.state, Artist.image_link),
+        ),
+        "detail": (
+            selectinload(Artist.shows).joinedload(Show.venue),
+            selectinload(Artist._genres),
+        ),
+        "delete": (
+            selectinload(Artist.shows), selectinload(Artist._genres)),
+    },
+    Show: {
+        "list": (
+            joinedload(Show.artist).load_only(
+                Artist.id, Artist.name, Artist.image_link),
+            joinedload(Show.venue).load_only(Venue.id, Venue.name),
+        ),
+    },
+}
+
+
+def load_profile(model, profile):
+    """Returns a query for the model with the named loading profile applied.
+
+    Args:
+        model: One of the mapped models.
+        profile: Key of the model in LOADING_PROFILES, e.g. "detail".
+    """
+    return model.query.options(*LOADING_PROFILES[model][profile])
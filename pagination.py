@@ -0,0 +1,145 @@
+from flask import abort, current_app, request, url_for
+from sqlalchemy import tuple_
+from datetime import datetime
+
+import base64
+import json
+
+
+def encode_cursor(values):
+    """Encodes the sort key values of a row into an opaque, url safe cursor."""
+    data = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def _decode_value(key, value):
+    python_type = key.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    # Exact types, as JSON true and false would pass for integers.
+    if type(value) is not python_type:
+        raise ValueError(f"Cursor value of {key.key} is not {python_type}.")
+    return value
+
+
+def decode_cursor(cursor, keys):
+    """Decodes a cursor back into sort key values typed like the key columns.
+
+    Raises:
+        ValueError: The cursor is malformed or does not match the keys.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(data, list) or len(data) != len(keys):
+            raise ValueError("Cursor does not match the sort keys.")
+        return [_decode_value(key, value) for key, value in zip(keys, data)]
+    except (TypeError, ValueError) as error:
+        raise ValueError("Malformed cursor.") from error
+
+
+class KeysetPage:
+    """A page of rows plus the cursors pointing to its neighbour pages."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def next_url(self):
+        return _page_url(after=self.next_cursor) if self.has_next else None
+
+    @property
+    def prev_url(self):
+        return _page_url(before=self.prev_cursor) if self.has_prev else None
+
+
+def _page_url(**cursor):
+    """Current request url with its paging cursor replaced."""
+    args = request.args.to_dict()
+    args.pop("after", None)
+    args.pop("before", None)
+    args.update(cursor)
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def _row_key(row, keys):
+    return [getattr(row, key.key) for key in keys]
+
+
+def paginate(query, keys, after=None, before=None, per_page=20):
+    """Paginates a query by seeking past the sort key of the last seen row.
+
+    Unlike OFFSET, each page costs an index range scan no matter how deep
+    the page is. `keys` must produce a unique order, so end them with the
+    primary key, and should be covered by an index.
+
+    Args:
+        query: Query whose rows expose the keys as attributes.
+        keys: Columns defining the ascending sort order, e.g.
+            (Artist.name, Artist.id).
+        after: Cursor of the last row of the previous page.
+        before: Cursor of the first row of the next page.
+        per_page: Maximum number of rows on the page.
+
+    Returns:
+        KeysetPage with the rows in ascending order.
+    """
+    if before is not None:
+        values = decode_cursor(before, keys)
+        rows = (
+            query.filter(tuple_(*keys) < tuple_(*values))
+            .order_by(*[key.desc() for key in keys])
+            .limit(per_page + 1)
+            .all()
+        )
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            values = decode_cursor(after, keys)
+            query = query.filter(tuple_(*keys) > tuple_(*values))
+        rows = query.order_by(*keys).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after is not None
+
+    page = KeysetPage(rows)
+    if rows and has_next:
+        page.next_cursor = encode_cursor(_row_key(rows[-1], keys))
+    if rows and has_prev:
+        page.prev_cursor = encode_cursor(_row_key(rows[0], keys))
+    return page
+
+
+def paginate_request(query, keys):
+    """Paginates a query using the cursor and page size of the request.
+
+    The page size defaults to PAGE_SIZE and is capped by MAX_PAGE_SIZE.
+    A malformed cursor aborts the request with 400.
+    """
+    per_page = request.args.get(
+        "per_page", current_app.config["PAGE_SIZE"], type=int)
+    per_page = max(1, min(per_page, current_app.config["MAX_PAGE_SIZE"]))
+    try:
+        return paginate(
+            query,
+            keys,
+            after=request.args.get("after"),
+            before=request.args.get("before"),
+            per_page=per_page,
+        )
+    except ValueError:
+        abort(400)
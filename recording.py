@@ -0,0 +1,74 @@
+from werkzeug.datastructures import MultiDict
+from werkzeug.urls import url_decode
+from datetime import datetime
+
+import threading
+import json
+import time
+import io
+
+# Form fields left out of recordings. CSRF tokens are bound to the session
+# of the recorded user and useless when replaying.
+SKIPPED_FIELDS = frozenset(("csrf_token",))
+
+
+class RequestRecorder:
+    """WSGI middleware appending a JSON line per request to a file.
+
+    Each line holds the time, method, path, query string, the fields of url
+    encoded forms, the response status and how long the response took,
+    until its body was sent. replay.py drives recordings against the app.
+
+    Args:
+        app: WSGI application to wrap, e.g. Flask.wsgi_app.
+        path: File the recordings are appended to.
+    """
+
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        record = {
+            "time": datetime.utcnow().isoformat(),
+            "method": environ["REQUEST_METHOD"],
+            "path": environ.get("PATH_INFO", ""),
+            "query": environ.get("QUERY_STRING", ""),
+            "form": self._form(environ),
+        }
+
+        def recording_start_response(status, headers, exc_info=None):
+            record["status"] = int(status.split(" ", 1)[0])
+            return start_response(status, headers, exc_info)
+
+        body = self.app(environ, recording_start_response)
+        try:
+            yield from body
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+            record["duration"] = time.perf_counter() - start
+            self.write(record)
+
+    def _form(self, environ):
+        """Fields of a url encoded body, which is put back to be read by
+        the application."""
+        content_type = environ.get("CONTENT_TYPE", "")
+        if not content_type.startswith("application/x-www-form-urlencoded"):
+            return None
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        data = environ["wsgi.input"].read(length)
+        environ["wsgi.input"] = io.BytesIO(data)
+        form = MultiDict(url_decode(data))
+        return {
+            name: form.getlist(name)
+            for name in form
+            if name not in SKIPPED_FIELDS
+        }
+
+    def write(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line)
@@ -0,0 +1,177 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import session
+from flask_wtf.csrf import generate_csrf
+from werkzeug.exceptions import HTTPException
+from urllib.parse import urlencode
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
+
+import threading
+import json
+import math
+import time
+
+
+def read_trace(path, methods=None):
+    """Reads the requests recorded by recording.RequestRecorder.
+
+    Args:
+        path: JSON lines file.
+        methods: If given, only requests with these methods are kept.
+    """
+    with open(path, encoding="utf-8") as file:
+        for text in file:
+            if not text.strip():
+                continue
+            record = json.loads(text)
+            if methods is None or record["method"] in methods:
+                yield record
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of sorted values."""
+    rank = max(1, math.ceil(fraction * len(values)))
+    return values[rank - 1]
+
+
+def route_of(app, record):
+    """Endpoint serving a recorded request, e.g. "show_venue"."""
+    adapter = app.url_map.bind("localhost")
+    try:
+        endpoint, _ = adapter.match(record["path"], method=record["method"])
+    except HTTPException:
+        return "<unmatched>"
+    return endpoint
+
+
+def _target(record):
+    if record["query"]:
+        return f"{record['path']}?{record['query']}"
+    return record["path"]
+
+
+class TestClientRunner:
+    """Sends requests in process through Flask test clients, one per thread.
+
+    Recordings carry no valid CSRF tokens, so every client gets one in its
+    session and sends it with each form. The app configuration is left as it
+    is.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _csrf_token(self, client):
+        """Signs a CSRF token and stores it in the session of the client."""
+        field = self.app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token")
+        with self.app.test_request_context():
+            token = generate_csrf()
+            raw_token = session[field]
+        with client.session_transaction() as client_session:
+            client_session[field] = raw_token
+        return {field: [token]}
+
+    def __call__(self, record):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+            self._local.csrf = self._csrf_token(client)
+        data = record["form"]
+        if data is not None:
+            data = dict(data, **self._local.csrf)
+        response = client.open(
+            _target(record), method=record["method"], data=data)
+        response.close()
+        return response.status_code
+
+
+class HTTPRunner:
+    """Sends requests over HTTP to a running server, e.g. a candidate build.
+    The server must run with WTF_CSRF_ENABLED=false to accept forms."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def __call__(self, record):
+        data = None
+        if record["form"] is not None:
+            data = urlencode(record["form"], doseq=True).encode()
+        request = Request(
+            self.base_url + _target(record), data=data,
+            method=record["method"])
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+
+def replay(records, runner, concurrency=1):
+    """Sends the records with `concurrency` parallel workers.
+
+    Returns:
+        (results, seconds) where results lists a (record, status, latency)
+        tuple per request and seconds is the wall time of the replay.
+    """
+
+    def send(record):
+        start = time.perf_counter()
+        status = runner(record)
+        return record, status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, records))
+    return results, time.perf_counter() - start
+
+
+def summarize(app, results, seconds):
+    """Request count, errors, throughput and latency percentiles per route.
+
+    Returns:
+        Dict of route to statistics, with the totals under "<all>".
+    """
+    latencies = {"<all>": []}
+    errors = {"<all>": 0}
+    for record, status, latency in results:
+        route = route_of(app, record)
+        for key in (route, "<all>"):
+            latencies.setdefault(key, []).append(latency)
+            errors[key] = errors.get(key, 0) + (status >= 500)
+
+    summary = {}
+    for route, values in latencies.items():
+        values.sort()
+        if not values:
+            continue
+        summary[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "throughput": len(values) / seconds if seconds else 0.0,
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+    return summary
+
+
+def format_summary(summary):
+    """Summary as a table, latencies in milliseconds."""
+    lines = [
+        f"{'route':<28}{'requests':>9}{'errors':>7}{'req/s':>9}"
+        f"{'p50':>9}{'p95':>9}{'p99':>9}"
+    ]
+    routes = sorted(route for route in summary if route != "<all>")
+    for route in routes + ["<all>"]:
+        if route not in summary:
+            continue
+        stats = summary[route]
+        lines.append(
+            f"{route:<28}{stats['requests']:>9}{stats['errors']:>7}"
+            f"{stats['throughput']:>9.1f}{stats['p50'] * 1000:>9.1f}"
+            f"{stats['p95'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,105 @@
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from flask import current_app, g, has_request_context, session
+from sqlalchemy import event, exc, orm
+from functools import wraps
+
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Replica bind keys that failed to connect, mapped to when to try them again.
+_down_until = {}
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from a replica during views marked with read_only.
+
+    Everything else goes to the primary: flushes, INSERT, UPDATE and DELETE
+    statements, other views and code running outside of requests.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if clause is not None and clause.is_dml:
+            self.info["wrote"] = True
+        elif not self._flushing and has_request_context():
+            replica = g.get("db_replica")
+            if replica is not None:
+                return get_state(self.app).db.get_engine(
+                    self.app, bind=replica)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _flushed(db_session, flush_context):
+    db_session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _stick_to_primary(db_session):
+    """After the user wrote, reads their own data from the primary for
+    REPLICA_STICKY_SECONDS, while the replicas catch up."""
+    if db_session.info.pop("wrote", False) and has_request_context():
+        session["db_primary_until"] = (
+            time.time() + current_app.config["REPLICA_STICKY_SECONDS"])
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _rolled_back(db_session):
+    db_session.info.pop("wrote", None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose sessions can read from the REPLICA_BINDS."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def _available_replicas():
+    now = time.time()
+    return [
+        key
+        for key in current_app.config["REPLICA_BINDS"]
+        if _down_until.get(key, 0) <= now
+    ]
+
+
+def pinned_to_primary():
+    """Whether the user of the request wrote in the last
+    REPLICA_STICKY_SECONDS, so that they read from the primary."""
+    return (has_request_context()
+            and session.get("db_primary_until", 0) > time.time())
+
+
+def read_only(view):
+    """Decorator running a view, which must not write, against a replica.
+
+    A random replica serves all queries of the request. The primary serves
+    them instead when no replica is configured or reachable, or when the
+    user wrote in the last REPLICA_STICKY_SECONDS. A replica that fails is
+    skipped for REPLICA_RETRY_SECONDS and the view runs again on the
+    primary.
+    """
+
+    @wraps(view)
+    def wrapper(**kwargs):
+        replicas = _available_replicas()
+        if not replicas or pinned_to_primary():
+            return view(**kwargs)
+
+        g.db_replica = random.choice(replicas)
+        try:
+            return view(**kwargs)
+        except exc.OperationalError as error:
+            logger.warning(
+                "Replica %s failed, reading from the primary: %s",
+                g.db_replica, error)
+            _down_until[g.db_replica] = (
+                time.time() + current_app.config["REPLICA_RETRY_SECONDS"])
+            g.db_replica = None
+            get_state(current_app).db.session.rollback()
+        return view(**kwargs)
+
+    return wrapper
@@ -0,0 +1,370 @@
+from model import db, Artist, Show, Venue, SHOW_DURATION_MAX
+from datetime import datetime, timedelta
+from dateutil.rrule import rrulestr
+from sqlalchemy import DDL, event
+from collections import defaultdict
+from itertools import islice
+
+import validation
+
+# Shows fetched per round trip while a whole window is streamed.
+STREAM_BATCH_SIZE = 500
+
+# Most shows scheduled at once, all inserted by one statement.
+MAX_BATCH = 100
+
+# Calendar periods shows can be grouped by, mapped to the SQLite datetime()
+# modifiers truncating a time to the start of the period. Weeks start on
+# Monday, like date_trunc('week', ...) on PostgreSQL.
+PERIODS = {
+    "day": ("start of day",),
+    "week": ("start of day", "weekday 0", "-6 days"),
+    "month": ("start of month",),
+}
+
+# A show overlapping a time started at most this long before it, so finding
+# one is a bounded range scan of ix_Show_venue_id_start_time or
+# ix_Show_artist_id_start_time.
+MAX_DURATION = timedelta(minutes=SHOW_DURATION_MAX)
+
+# Constraints keeping venues and artists from being booked twice at once,
+# the column they apply to and the error reported to the form. Migration
+# d81f5a3c2e47 creates the PostgreSQL ones as well, in line with the DDL
+# here.
+BOOKINGS = {
+    "ex_Show_venue_booking": (
+        "venue_id", "The venue is already booked at that time."),
+    "ex_Show_artist_booking": (
+        "artist_id", "The artist is already booked at that time."),
+}
+
+# Times are stored by SQLAlchemy in SQLite as "YYYY-MM-DD HH:MM:SS.ffffff"
+# text, and compared as such.
+_SQLITE_SECONDS = "%Y-%m-%d %H:%M:%S"
+
+
+def _exclusion_ddl(name, column):
+    # GiST has no = operator for integers without the btree_gist extension,
+    # one element ranges compare equal through the built-in range_ops.
+    return (
+        f'ALTER TABLE "Show" ADD CONSTRAINT "{name}" EXCLUDE USING gist '
+        f"(int4range({column}, {column}, '[]') WITH =, "
+        f"tsrange(_start_time, _start_time + duration * interval '1 minute')"
+        f" WITH &&)"
+    )
+
+
+def _trigger_ddl(name, column, operation):
+    # The range on s._start_time is what keeps the lookup on the index.
+    # Shifting by whole minutes keeps the microseconds, which are cut off
+    # first and put back as they were, so the times compare exactly.
+    def shifted(table, minutes):
+        stored = f"{table}._start_time"
+        return (f"(strftime('{_SQLITE_SECONDS}', substr({stored}, 1, 19), "
+                f"{minutes} || ' minutes') || substr({stored}, 20))")
+
+    return (
+        f'CREATE TRIGGER "{name}_{operation.split()[0].lower()}" '
+        f'BEFORE {operation} ON "Show" WHEN EXISTS ('
+        f'SELECT 1 FROM "Show" s WHERE s.{column} = NEW.{column} '
+        f"AND s._start_time > {shifted('NEW', -SHOW_DURATION_MAX)} "
+        f"AND s._start_time < {shifted('NEW', 'NEW.duration')} "
+        f"AND {shifted('s', 's.duration')} > NEW._start_time "
+        f"AND s.id IS NOT NEW.id) "
+        f"BEGIN SELECT RAISE(ABORT, 'overlaps a booking ({name})'); END"
+    )
+
+
+for _name, (_column, _) in BOOKINGS.items():
+    event.listen(
+        Show.__table__,
+        "after_create",
+        DDL(_exclusion_ddl(_name, _column)).execute_if(dialect="postgresql"),
+    )
+    for _operation in (
+        "INSERT",
+        f"UPDATE OF {_column}, _start_time, duration",
+    ):
+        event.listen(
+            Show.__table__,
+            "after_create",
+            # DDL() formats statements with %, as in strftime().
+            DDL(_trigger_ddl(_name, _column, _operation).replace("%", "%%"))
+            .execute_if(dialect="sqlite"),
+        )
+
+
+def batch_conflicts(shows, show_id=None):
+    """Finds the bookings each show of a batch would overlap, with a single
+    query.
+
+    Only the shows of the venues and of the artists starting within
+    MAX_DURATION before each show and its end are read, however long their
+    calendars are. Shows earlier in the batch count as bookings too, unless
+    they overlap a booking themselves. The database enforces the same rule
+    on write, see BOOKINGS.
+
+    Args:
+        shows: Dicts of the venue_id, artist_id, start_time and duration in
+            minutes of the shows.
+        show_id: Id of the show when it exists, not a conflict of its own.
+
+    Returns:
+        List of dicts, one per show, of "venue_id" and/or "artist_id" to the
+        error message of the booking overlapped, empty when the show fits.
+    """
+    windows = [
+        db.and_(
+            getattr(Show, column) == show[column],
+            Show._start_time > show["start_time"] - MAX_DURATION,
+            Show._start_time < show["start_time"] + timedelta(
+                minutes=show["duration"]),
+        )
+        for show in shows
+        for column, _ in BOOKINGS.values()
+    ]
+    query = db.session.query(
+        Show.venue_id, Show.artist_id, Show._start_time, Show.duration
+    ).filter(db.or_(*windows))
+    if show_id is not None:
+        query = query.filter(Show.id != show_id)
+
+    # (column, id) to the (start, end) of their bookings.
+    booked = defaultdict(list)
+
+    def book(venue_id, artist_id, start_time, duration):
+        end_time = start_time + timedelta(minutes=duration)
+        booked["venue_id", venue_id].append((start_time, end_time))
+        booked["artist_id", artist_id].append((start_time, end_time))
+
+    for row in query:
+        book(*row)
+    found = []
+    for show in shows:
+        start_time = show["start_time"]
+        end_time = start_time + timedelta(minutes=show["duration"])
+        found.append({
+            column: message
+            for column, message in BOOKINGS.values()
+            if any(
+                start < end_time and end > start_time
+                for start, end in booked[column, show[column]]
+            )
+        })
+        if not found[-1]:
+            book(show["venue_id"], show["artist_id"], start_time,
+                 show["duration"])
+    return found
+
+
+def conflicts(venue_id, artist_id, start_time, duration, show_id=None):
+    """Finds the bookings a single show would overlap, see
+    batch_conflicts()."""
+    show = {
+        "venue_id": venue_id,
+        "artist_id": artist_id,
+        "start_time": start_time,
+        "duration": duration,
+    }
+    return batch_conflicts([show], show_id)[0]
+
+
+def booking_conflict(error):
+    """Column and message of the booking constraint an IntegrityError
+    violated, or None when it violated another constraint."""
+    text = str(getattr(error, "orig", error))
+    for name, booking in BOOKINGS.items():
+        if name in text:
+            return booking
+    return None
+
+
+def _date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def filter_args(args):
+    """Reads the show filters of a query string.
+
+    `from` and `to` are days as YYYY-MM-DD, both included in the window.
+    `venue_id` and `artist_id` are ids, `city` is the city of the venue.
+
+    Returns:
+        Dict of the filters given, with "to" moved to the start of the next
+        day.
+
+    Raises:
+        ValueError: A day or id is malformed.
+    """
+    filters = {}
+    if args.get("from"):
+        filters["from"] = _date(args["from"])
+    if args.get("to"):
+        filters["to"] = _date(args["to"]) + timedelta(days=1)
+    for name in ("venue_id", "artist_id"):
+        if args.get(name):
+            filters[name] = int(args[name])
+    if args.get("city"):
+        filters["city"] = args["city"]
+    return filters
+
+
+def filtered(query, filters):
+    """Narrows a query over shows to the filters of filter_args().
+
+    The window is a range of ix_Show_start_time, or of the venue and artist
+    indexes when they are filtered on too.
+    """
+    if "from" in filters:
+        query = query.filter(Show._start_time >= filters["from"])
+    if "to" in filters:
+        query = query.filter(Show._start_time < filters["to"])
+    if "venue_id" in filters:
+        query = query.filter(Show.venue_id == filters["venue_id"])
+    if "artist_id" in filters:
+        query = query.filter(Show.artist_id == filters["artist_id"])
+    if "city" in filters:
+        query = query.filter(Show.venue_id.in_(
+            db.select(Venue.id).where(Venue.city == filters["city"])))
+    return query
+
+
+def period_start(period):
+    """SQL expression of the start of the day, week or month of a show."""
+    if db.engine.dialect.name == "postgresql":
+        start = db.func.date_trunc(period, Show._start_time)
+    else:
+        start = db.func.datetime(Show._start_time, *PERIODS[period])
+    return db.type_coerce(start, db.DateTime).label("period")
+
+
+def period_counts(filters, period):
+    """Number of shows matching the filters per day, week or month.
+
+    Returns:
+        Dict of the start of each period to its show count.
+    """
+    start = period_start(period)
+    query = filtered(db.session.query(start, db.func.count(Show.id)), filters)
+    return dict(query.group_by(start).order_by(start))
+
+
+def tour_items(text):
+    """Reads the dates of a tour, one show per line as a venue id and a
+    start time separated by a comma. Blank lines are skipped.
+
+    Returns:
+        List of (label, record) pairs, labelled by line number.
+    """
+    items = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if line.strip():
+            venue_id, _, start_time = line.partition(",")
+            items.append((f"Line {number}", {
+                "venue_id": venue_id.strip(),
+                "start_time": start_time.strip(),
+            }))
+    return items
+
+
+def recurrence_items(rule, venue_id, start_time):
+    """Expands a residency, an RFC 5545 recurrence rule such as
+    FREQ=WEEKLY;BYDAY=FR;COUNT=8, from its first start time.
+
+    Returns:
+        List of (label, record) pairs, labelled by start time.
+
+    Raises:
+        ValueError: The rule is malformed or gives more than MAX_BATCH
+            shows.
+    """
+    try:
+        starts = list(islice(rrulestr(rule, dtstart=start_time),
+                             MAX_BATCH + 1))
+    except ValueError as error:
+        raise ValueError(f"Invalid recurrence rule: {error}.") from None
+    if len(starts) > MAX_BATCH:
+        raise ValueError(
+            f"The recurrence rule gives more than {MAX_BATCH} shows.")
+    return [
+        (f"{start:%Y-%m-%d %H:%M}",
+         {"venue_id": venue_id, "start_time": start})
+        for start in starts
+    ]
+
+
+def validate_batch(artist_id, duration, items):
+    """Validates the shows of an artist together, with the rules of
+    validation.SHOW, the existing venues and the bookings of the venues,
+    the artist and the batch itself.
+
+    Args:
+        artist_id: Artist of every show.
+        duration: Length of every show in minutes.
+        items: (label, record) pairs of the venue_id and start_time of each
+            show, as returned by tour_items() and recurrence_items().
+
+    Returns:
+        (rows, errors) where rows are the values of the shows to insert,
+        complete only when errors, messages prefixed by the label of their
+        show, is empty.
+    """
+    if len(items) > MAX_BATCH:
+        return [], [f"At most {MAX_BATCH} shows are scheduled at once."]
+    if db.session.query(Artist.id).filter_by(id=artist_id).scalar() is None:
+        return [], [f"Unknown artist {artist_id}."]
+
+    # Messages of each show, listed in the order of the shows.
+    errors = {label: [] for label, _ in items}
+    rows = []
+    for label, record in items:
+        values, field_errors = validation.SHOW.validate(
+            dict(record, artist_id=artist_id, duration=duration))
+        if field_errors:
+            for messages in field_errors.values():
+                errors[label].extend(messages)
+        else:
+            rows.append((label, values))
+
+    venue_ids = {
+        id_ for id_, in db.session.query(Venue.id).filter(
+            Venue.id.in_({values["venue_id"] for _, values in rows}))
+    }
+    for label, values in rows:
+        if values["venue_id"] not in venue_ids:
+            errors[label].append(f"Unknown venue {values['venue_id']}.")
+    rows = [(label, values) for label, values in rows
+            if values["venue_id"] in venue_ids]
+
+    if rows:
+        found = batch_conflicts([values for _, values in rows])
+        for (label, _), booked in zip(rows, found):
+            errors[label].extend(booked.values())
+    return [values for _, values in rows], [
+        f"{label}: {message}"
+        for label, messages in errors.items()
+        for message in messages
+    ]
+
+
+def insert_batch(rows):
+    """Inserts shows validated by validate_batch() with a single multi-row
+    INSERT, and bumps updated_at of their artists and venues like the flush
+    hook of the ORM does. Left to the caller to commit."""
+    now = datetime.utcnow()
+    db.session.execute(Show.__table__.insert().values([
+        {
+            "artist_id": row["artist_id"],
+            "venue_id": row["venue_id"],
+            "_start_time": row["start_time"],
+            "duration": row["duration"],
+            "updated_at": now,
+        }
+        for row in rows
+    ]))
+    for model, column in ((Artist, "artist_id"), (Venue, "venue_id")):
+        db.session.execute(
+            db.update(model)
+            .where(model.id.in_({row[column] for row in rows}))
+            .values(updated_at=now)
+        )
@@ -0,0 +1,171 @@
+from model import db, Artist, Genre, Venue, GENRE_LINKS
+from sqlalchemy import DDL, event
+
+import re
+
+# Full-text documents are built from these columns. On PostgreSQL the
+# expression must stay identical to the one of the ix_<table>_search GIN
+# indexes created in migration c4e9a2b7d610, otherwise they are not used.
+SEARCH_CONFIG = "simple"
+
+# SQLite has no tsvector, an external content FTS5 table per model mirrors the
+# searchable columns instead and is kept in sync by triggers.
+FTS5_TABLES = {Venue: "venue_search", Artist: "artist_search"}
+
+
+def _fts5_ddl(table, fts_table):
+    return [
+        f'CREATE VIRTUAL TABLE {fts_table} USING fts5('
+        f"name, city, content='{table}', content_rowid='id')",
+        f'CREATE TRIGGER {fts_table}_ai AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO {fts_table}(rowid, name, city) '
+        f'VALUES (new.id, new.name, new.city); END',
+        f'CREATE TRIGGER {fts_table}_ad AFTER DELETE ON "{table}" BEGIN '
+        f'INSERT INTO {fts_table}({fts_table}, rowid, name, city) '
+        f"VALUES ('delete', old.id, old.name, old.city); END",
+        f'CREATE TRIGGER {fts_table}_au AFTER UPDATE ON "{table}" BEGIN '
+        f'INSERT INTO {fts_table}({fts_table}, rowid, name, city) '
+        f"VALUES ('delete', old.id, old.name, old.city); "
+        f'INSERT INTO {fts_table}(rowid, name, city) '
+        f'VALUES (new.id, new.name, new.city); END',
+    ]
+
+
+for _model, _fts_table in FTS5_TABLES.items():
+    for _statement in _fts5_ddl(_model.__tablename__, _fts_table):
+        event.listen(
+            _model.__table__,
+            "after_create",
+            DDL(_statement).execute_if(dialect="sqlite"),
+        )
+
+
+def search_document(model):
+    """tsvector over the name and city of a venue or artist."""
+    return db.func.to_tsvector(SEARCH_CONFIG, model.name + " " + model.city)
+
+
+def _words(term):
+    return re.findall(r"\w+", term)
+
+
+def _like_pattern(term):
+    escaped = re.sub(r"([\\%_])", r"\\\1", term)
+    return f"%{escaped}%"
+
+
+def _genre_match(model, term):
+    """Venues or artists with a genre starting with the term. The few
+    matching genres are found first, then their rows through the genre_id
+    index of the link table."""
+    table, owner = GENRE_LINKS[model]
+    genre_ids = db.select(Genre.id).where(
+        Genre.name.ilike(_like_pattern(term)[1:], escape="\\"))
+    return model.id.in_(
+        db.select(owner).where(table.c.genre_id.in_(genre_ids)))
+
+
+def _rank_postgresql(query, model, term):
+    """Returns the query, its match condition and its relevance ordering."""
+    words = _words(term)
+    matches = model.name.ilike(_like_pattern(term), escape="\\")
+    relevance = []
+    if words:
+        # Every word of the term as a prefix, so partially typed words match.
+        tsquery = db.func.to_tsquery(
+            SEARCH_CONFIG, " & ".join(f"{word}:*" for word in words))
+        document = search_document(model)
+        matches = db.or_(document.op("@@")(tsquery), matches)
+        relevance.append(db.func.ts_rank(document, tsquery).desc())
+    return query, matches, relevance
+
+
+def _rank_sqlite(query, model, term):
+    """Returns the query, its match condition and its relevance ordering."""
+    words = _words(term)
+    matches = model.name.ilike(_like_pattern(term), escape="\\")
+    relevance = []
+    if words:
+        fts_table = FTS5_TABLES[model]
+        hits = (
+            db.select(
+                db.literal_column("rowid").label("id"),
+                db.literal_column("rank").label("rank"),
+            )
+            .select_from(db.table(fts_table))
+            .where(
+                db.literal_column(fts_table).op("MATCH")(
+                    " ".join(f'"{word}"*' for word in words))
+            )
+            .subquery()
+        )
+        query = query.outerjoin(hits, hits.c.id == model.id)
+        matches = db.or_(hits.c.id.isnot(None), matches)
+        # FTS5 ranks with bm25, where lower is more relevant.
+        relevance.append(db.func.coalesce(hits.c.rank, 0))
+    return query, matches, relevance
+
+
+def name_key(model):
+    """Lower cased name, compared bytewise on PostgreSQL.
+
+    Must match the ix_<table>_name_prefix indexes of migration 5a7c3e1f8b24.
+    With the "C" collation a plain btree index serves both the prefix LIKE
+    and the ordering, which a pattern_ops index cannot.
+    """
+    key = db.func.lower(model.name)
+    if db.engine.dialect.name == "postgresql":
+        key = db.collate(key, "C")
+    return key
+
+
+def prefixed(model, term, limit):
+    """Venues or artists whose name starts with the term, ignoring case.
+
+    Args:
+        model: Venue or Artist.
+        term: Start of the name as typed by the user.
+        limit: Maximum number of rows.
+
+    Returns:
+        Query of (id, name) rows ordered by name.
+    """
+    key = name_key(model)
+    query = db.session.query(model.id, model.name)
+    term = term.strip().lower()
+    if term:
+        query = query.filter(
+            key.like(_like_pattern(term)[1:], escape="\\"))
+    return query.order_by(key, model.id).limit(limit)
+
+
+def ranked(model, term):
+    """Searches venues or artists, most relevant first.
+
+    Matches the term as word prefixes against name and city using the
+    full-text index of the database, as a substring of the name (served by
+    a trigram index on PostgreSQL) and as the start of a genre. Names
+    starting with the term come first.
+
+    Args:
+        model: Venue or Artist.
+        term: Search term as typed by the user.
+
+    Returns:
+        Query of (id, name, upcoming_shows_count) rows.
+    """
+    term = term.strip()
+    query = db.session.query(model.id, model.name, model.upcoming_shows_count)
+    if not term:
+        return query.order_by(model.name, model.id)
+
+    if db.engine.dialect.name == "postgresql":
+        rank = _rank_postgresql
+    else:
+        rank = _rank_sqlite
+    query, matches, relevance = rank(query, model, term)
+    matches = db.or_(matches, _genre_match(model, term))
+    starts_with = model.name.ilike(_like_pattern(term)[1:], escape="\\")
+    return query.filter(matches).order_by(
+        db.case((starts_with, 0), else_=1), *relevance, model.name, model.id
+    )
@@ -0,0 +1,278 @@
+from datetime import datetime, timedelta
+from model import db, Artist, Venue, Show
+from schedule import MAX_DURATION
+from collections import Counter, defaultdict
+from itertools import accumulate, islice
+from enums import Genre, State
+
+import random
+import bulk
+
+GENRES = [genre.value for genre in Genre]
+STATES = [state.value for state in State]
+
+# Town names found in many states, combined with any state.
+CITIES = [
+    "Springfield", "Franklin", "Greenville", "Clinton", "Madison",
+    "Georgetown", "Salem", "Fairview", "Riverside", "Bristol", "Dover",
+    "Arlington", "Ashland", "Burlington", "Manchester", "Oxford",
+    "Jackson", "Milton", "Newport", "Auburn", "Centerville", "Lexington",
+]
+ADJECTIVES = [
+    "Blue", "Electric", "Velvet", "Midnight", "Golden", "Wild", "Silent",
+    "Crimson", "Lucky", "Broken", "Neon", "Rolling", "Hollow", "Bright",
+    "Lonesome", "Iron", "Paper", "Smoky", "Restless", "Northern",
+]
+NOUNS = [
+    "Foxes", "Rivers", "Pilots", "Echoes", "Saints", "Wolves", "Strangers",
+    "Horses", "Ghosts", "Lanterns", "Sparrows", "Machines", "Tigers",
+    "Drifters", "Comets", "Kings", "Shadows", "Sailors", "Bandits", "Owls",
+]
+PLACES = [
+    "Hall", "Lounge", "Room", "Theater", "Club", "Tavern", "Ballroom",
+    "Garden", "Barn", "Cellar", "Stage", "Saloon", "Pavilion", "Warehouse",
+]
+
+# Share of shows in the past, spread over PAST_DAYS, the others are upcoming
+# within FUTURE_DAYS.
+PAST_SHARE = 0.7
+PAST_DAYS = 5 * 365
+FUTURE_DAYS = 365
+
+# Zipf exponent of how shows concentrate on few venues and artists.
+VENUE_SKEW = 1.2
+ARTIST_SKEW = 0.8
+
+# Lengths of the generated shows in minutes, and how many times a venue and
+# an artist are drawn before giving up on finding them a free evening slot.
+DURATIONS = (60, 90, 120)
+MAX_ATTEMPTS = 100
+
+# Shows start on one of the STARTS half hours from 6 pm, up to 11:30 pm,
+# and end by 1:30 am, so shows of different days never overlap.
+HALF_HOUR = timedelta(minutes=30)
+STARTS = 12
+EVENING = (timedelta(hours=18), timedelta(hours=25, minutes=30))
+EVENING_HALF_HOURS = (EVENING[1] - EVENING[0]) // HALF_HOUR
+
+
+def _phone(rng):
+    return (f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-"
+            f"{rng.randint(0, 9999):04d}")
+
+
+def _name(rng, number, words):
+    # The number keeps names unique however many rows are generated.
+    return f"The {rng.choice(ADJECTIVES)} {rng.choice(words)} {number}"
+
+
+def _profile(rng, number, words):
+    return {
+        "name": _name(rng, number, words),
+        "city": rng.choice(CITIES),
+        "state": rng.choice(STATES),
+        "phone": _phone(rng),
+        "genres": rng.sample(GENRES, rng.randint(1, 3)),
+        "seeking_description": None,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def artists(rng, count):
+    """Yields rows of the Artist table."""
+    for number in range(1, count + 1):
+        row = _profile(rng, number, NOUNS)
+        row["seeking_venue"] = rng.random() < 0.2
+        if row["seeking_venue"]:
+            row["seeking_description"] = "Looking for places to play."
+        yield row
+
+
+def venues(rng, count):
+    """Yields rows of the Venue table."""
+    for number in range(1, count + 1):
+        row = _profile(rng, number, PLACES)
+        row["address"] = f"{rng.randint(1, 9999)} Main Street"
+        row["seeking_talent"] = rng.random() < 0.2
+        if row["seeking_talent"]:
+            row["seeking_description"] = "Looking for local acts."
+        yield row
+
+
+def _zipf_weights(count, skew):
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def _days(rng, count, today):
+    """Days of the shows with the number of shows on each, in order."""
+    days = Counter()
+    for _ in range(count):
+        if rng.random() < PAST_SHARE:
+            days[-rng.randint(1, PAST_DAYS)] += 1
+        else:
+            days[rng.randint(0, FUTURE_DAYS)] += 1
+    return [(today + timedelta(days=offset), days[offset])
+            for offset in sorted(days)]
+
+
+def _cells(start, minutes):
+    """Bit mask of the half hours of an evening a show overlaps, from the
+    first start of the evening on."""
+    first = max(start // HALF_HOUR, 0)
+    last = min(-(-(start + timedelta(minutes=minutes)) // HALF_HOUR),
+               EVENING_HALF_HOURS)
+    return ((1 << max(last - first, 0)) - 1) << first
+
+
+def shows(rng, count, artist_ids, venue_ids, today, booked=None):
+    """Yields rows of the Show table, in the order of their days.
+
+    A few venues and artists get most of the shows, the way a handful of
+    popular venues book far more often than the rest. Starts are on the hour
+    or half hour between 6 and 11:30 pm. A show takes the first slot of its
+    evening from a random one where its venue and artist are both free, as
+    the database rejects overlapping shows, or another venue and artist
+    when there is none. Only the bookings of the current evening are held,
+    as a bit mask of half hours per venue and artist.
+
+    Args:
+        booked: Function of a day returning the (artist id, venue id, start
+            time, duration) of the existing shows of its evening.
+    """
+    # Shuffled first, so hot rows are not simply the oldest ones.
+    artist_ids, venue_ids = list(artist_ids), list(venue_ids)
+    rng.shuffle(artist_ids)
+    rng.shuffle(venue_ids)
+    artist_weights = _zipf_weights(len(artist_ids), ARTIST_SKEW)
+    venue_weights = _zipf_weights(len(venue_ids), VENUE_SKEW)
+    now = datetime.utcnow()
+    for day, day_count in _days(rng, count, today):
+        evening = day + EVENING[0]
+        # (column, id) to the half hours booked.
+        bookings = defaultdict(int)
+        for artist_id, venue_id, start_time, duration in (
+            booked(day) if booked else ()
+        ):
+            cells = _cells(start_time - evening, duration)
+            bookings["artist_id", artist_id] |= cells
+            bookings["venue_id", venue_id] |= cells
+
+        for _ in range(day_count):
+            yield _place(rng, evening, bookings, artist_ids, artist_weights,
+                         venue_ids, venue_weights, now)
+
+
+def _place(rng, evening, bookings, artist_ids, artist_weights, venue_ids,
+           venue_weights, now):
+    for _ in range(MAX_ATTEMPTS):
+        artist_id = rng.choices(artist_ids, cum_weights=artist_weights)[0]
+        venue_id = rng.choices(venue_ids, cum_weights=venue_weights)[0]
+        duration = rng.choice(DURATIONS)
+        first = rng.randrange(STARTS)
+        taken = (bookings["artist_id", artist_id]
+                 | bookings["venue_id", venue_id])
+        for index in range(STARTS):
+            start = (first + index) % STARTS
+            cells = ((1 << -(-duration // 30)) - 1) << start
+            if not taken & cells:
+                bookings["artist_id", artist_id] |= cells
+                bookings["venue_id", venue_id] |= cells
+                return {
+                    "artist_id": artist_id,
+                    "venue_id": venue_id,
+                    "_start_time": evening + start * HALF_HOUR,
+                    "duration": duration,
+                    "updated_at": now,
+                }
+    raise ValueError(
+        f"No free evening left for more shows on {evening:%Y-%m-%d}.")
+
+
+def _insert(model, rows, batch_size, copy):
+    inserted = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return inserted
+        bulk.insert_records(model, batch, copy=copy)
+        db.session.commit()
+        inserted += len(batch)
+
+
+def seed(artist_count, venue_count, show_count, seed=0, today=None,
+         batch_size=10000, copy=None):
+    """Inserts generated artists, venues and shows in bulk.
+
+    The same seed and day generate the same rows in the same database. Shows
+    are spread over all artists and venues, including the ones that existed
+    before, without overlapping the shows they had.
+
+    Args:
+        artist_count: Number of artists to add.
+        venue_count: Number of venues to add.
+        show_count: Number of shows to add.
+        seed: Seed of the random generator.
+        today: Day the past and upcoming shows are relative to, defaults
+            to the current day.
+        batch_size: Rows per insert statement and transaction.
+        copy: Use COPY, defaults to whether the database is PostgreSQL.
+
+    Returns:
+        Dict of the number of rows inserted per table.
+    """
+    rng = random.Random(seed)
+    if today is None:
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+    if copy is None:
+        copy = db.engine.dialect.name == "postgresql"
+    last_artist_id = db.session.query(db.func.max(Artist.id)).scalar()
+    last_venue_id = db.session.query(db.func.max(Venue.id)).scalar()
+
+    counts = {
+        "artists": _insert(
+            Artist, artists(rng, artist_count), batch_size, copy),
+        "venues": _insert(Venue, venues(rng, venue_count), batch_size, copy),
+    }
+    artist_ids = [
+        id_ for id_, in db.session.query(Artist.id).order_by(Artist.id)]
+    venue_ids = [
+        id_ for id_, in db.session.query(Venue.id).order_by(Venue.id)]
+    if show_count and not (artist_ids and venue_ids):
+        raise ValueError("Shows need at least one artist and one venue.")
+    booked = None
+    if db.session.query(Show.id).first() is not None:
+        # Looked up evening by evening on ix_Show_start_time. Shows seeded
+        # here are on other evenings than the ones still to generate.
+        def booked(day):
+            return db.session.query(
+                Show.artist_id, Show.venue_id, Show._start_time,
+                Show.duration,
+            ).filter(
+                Show._start_time > day + EVENING[0] - MAX_DURATION,
+                Show._start_time < day + EVENING[1],
+            ).all()
+
+    counts["shows"] = _insert(
+        Show,
+        shows(rng, show_count, artist_ids, venue_ids, today, booked),
+        batch_size,
+        copy,
+    )
+
+    # Rows that existed before may have got shows, which bulk inserts do not
+    # record in their updated_at like the ORM flush hook does.
+    if counts["shows"]:
+        now = datetime.utcnow()
+        for model, last_id in (
+            (Artist, last_artist_id),
+            (Venue, last_venue_id),
+        ):
+            if last_id is not None:
+                db.session.execute(
+                    db.update(model)
+                    .where(model.id <= last_id)
+                    .values(updated_at=now)
+                )
+        db.session.commit()
+    return counts
@@ -0,0 +1,54 @@
+// Suggests names from a typeahead endpoint while typing into an input with
+// data-typeahead="<endpoint>" and a datalist, and stores the id of the chosen
+// name in the hidden field named by data-target.
+(function () {
+  var DELAY = 150;
+
+  function attach(input) {
+    var options = document.getElementById(input.getAttribute('list'));
+    var target = document.getElementById(input.getAttribute('data-target'));
+    var ids = {};
+    var timer = null;
+    var pending = null;
+
+    function select() {
+      target.value = ids.hasOwnProperty(input.value) ? ids[input.value] : '';
+    }
+
+    function suggest() {
+      if (pending) {
+        pending.abort();
+      }
+      var request = new XMLHttpRequest();
+      request.open('GET', input.getAttribute('data-typeahead') +
+        '?q=' + encodeURIComponent(input.value));
+      request.onload = function () {
+        if (request.status !== 200) {
+          return;
+        }
+        ids = {};
+        options.innerHTML = '';
+        JSON.parse(request.responseText).data.forEach(function (item) {
+          var option = document.createElement('option');
+          option.value = item.name;
+          ids[item.name] = item.id;
+          options.appendChild(option);
+        });
+        select();
+      };
+      request.send();
+      pending = request;
+    }
+
+    input.addEventListener('input', function () {
+      select();
+      clearTimeout(timer);
+      timer = setTimeout(suggest, DELAY);
+    });
+  }
+
+  var inputs = document.querySelectorAll('input[data-typeahead]');
+  for (var i = 0; i < inputs.length; i++) {
+    attach(inputs[i]);
+  }
+})();
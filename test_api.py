@@ -1,6 +1,92 @@
+import os
+
+# The suite runs on an in-memory SQLite database, or on the database named
+# by TEST_DATABASE_URI, e.g. a migrated PostgreSQL one where the query plans
+# are checked too. Set before the app reads its configuration.
+os.environ["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "TEST_DATABASE_URI", "sqlite://")
+
 import unittest
 from flask_testing import TestCase
-from app import app
+from unittest.mock import patch
+from flask import Flask, g
+from flask_sqlalchemy import get_state
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy import create_engine, event
+from model import db, Artist, Venue, Show
+from cache import MemoryCache, create_backend
+from app import app, format_datetime, page_cache, sql_instrumentation
+from recording import RequestRecorder
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+import babel.dates
+import dateutil.parser
+import subprocess
+import tempfile
+import json
+import random
+import validation
+import bulk
+import schedule
+import search
+import replay
+import pagination
+import routing
+import metrics
+import dbpool
+import time
+import sys
+import seed
+import benchmark
+
+VENUES = [
+    dict(name="The Musical Hop", city="San Francisco", state="CA",
+         address="1015 Folsom", phone="123-123-1234",
+         genres=["Jazz", "Reggae"], seeking_talent=True),
+    dict(name="Park Square", city="San Francisco", state="CA",
+         address="34 Whiskey", phone="415-000-1234",
+         genres=["Rock n Roll", "Jazz"]),
+    dict(name="The Dueling Pianos", city="New York", state="NY",
+         address="335 Delancey", phone="914-003-1132",
+         genres=["Classical", "R&B"]),
+]
+ARTISTS = [
+    dict(name="Guns N Petals", city="San Francisco", state="CA",
+         phone="326-123-5000", genres=["Rock n Roll"], seeking_venue=True),
+    dict(name="Matt Quevedo", city="New York", state="NY",
+         phone="300-400-5000", genres=["Jazz"]),
+    dict(name="The Wild Sax Band", city="San Francisco", state="CA",
+         phone="432-325-5432", genres=["Jazz", "Classical"]),
+]
+# (artist, venue, start time) by position in the lists above.
+SHOWS = [
+    (0, 0, datetime(2019, 5, 21, 21, 30)),
+    (1, 2, datetime(2019, 6, 15, 23, 0)),
+    (2, 2, datetime(2035, 4, 1, 20, 0)),
+    (2, 2, datetime(2035, 4, 8, 20, 0)),
+    (2, 0, datetime(2035, 4, 15, 20, 0)),
+]
+
+
+def setUpModule():
+    """Creates the schema of an empty database, e.g. in-memory SQLite, and
+    fills it with a few venues, artists and shows."""
+    with app.app_context():
+        db.create_all()
+        if Venue.query.first() is not None:
+            return
+        venues = [Venue(**fields) for fields in VENUES]
+        artists = [Artist(**fields) for fields in ARTISTS]
+        db.session.add_all(venues + artists)
+        db.session.add_all(
+            Show(artist=artists[artist], venue=venues[venue],
+                 start_time=start_time)
+            for artist, venue, start_time in SHOWS
+        )
+        db.session.commit()
 
 
 class TestApp(TestCase):
@@ -20,5 +106,1066 @@ class TestApp(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class TestIndexUsage(TestCase):
+    """Checks that route queries are planned on the access path indexes."""
+
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        if db.engine.dialect.name != "postgresql":
+            self.skipTest("Query plans are only checked on PostgreSQL.")
+
+    def plans(self, url):
+        """Requests the url and returns the EXPLAIN output of its queries.
+        Sequential scans are disabled, so any usable index is picked even on
+        tiny tables."""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, many):
+            if statement.lstrip().upper().startswith("SELECT"):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        plans = []
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql("SET enable_seqscan = off")
+            for statement, parameters in statements:
+                rows = connection.exec_driver_sql(
+                    "EXPLAIN " + statement, parameters)
+                plans.append("\n".join(row[0] for row in rows))
+        return "\n".join(plans)
+
+    def test_venues_uses_area_and_show_indexes(self):
+        plans = self.plans("/venues")
+        self.assertIn("ix_Venue_city_state", plans)
+        self.assertIn("ix_Show_venue_id_start_time", plans)
+
+    def test_shows_uses_start_time_index(self):
+        self.assertIn("ix_Show_start_time", self.plans("/shows"))
+
+    def test_detail_pages_use_show_indexes(self):
+        venue = Venue.query.first()
+        artist = Artist.query.first()
+        if venue is None or artist is None:
+            self.skipTest("Needs at least one venue and artist.")
+        self.assertIn(
+            "ix_Show_venue_id_start_time", self.plans(f"/venues/{venue.id}"))
+        self.assertIn(
+            "ix_Show_artist_id_start_time",
+            self.plans(f"/artists/{artist.id}"),
+        )
+
+    def test_genre_filter_uses_link_index(self):
+        self.assertIn(
+            "ix_VenueGenre_genre_id_venue_id",
+            self.plans("/venues?genre=Jazz&state=NY"),
+        )
+
+    def test_show_window_uses_start_time_index(self):
+        self.assertIn(
+            "ix_Show_start_time", self.plans("/shows?from=2030-01-01"))
+
+
+class TestPageCache(TestCase):
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        self.backend = page_cache.backend
+        page_cache.backend = MemoryCache()
+
+    def tearDown(self):
+        page_cache.backend = self.backend
+
+    def count_queries(self, url):
+        queries = []
+
+        def record(*args):
+            queries.append(args)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return len(queries)
+
+    def test_cached_page_is_served_without_page_queries(self):
+        rendered = self.count_queries("/artists")
+        self.assertLess(self.count_queries("/artists"), rendered)
+
+    def test_invalidated_page_is_rendered_again(self):
+        self.count_queries("/venues")
+        page_cache.invalidate("venues")
+        self.assertGreater(self.count_queries("/venues"), 0)
+
+
+class TestConditionalGet(TestCase):
+    def create_app(self):
+        return app
+
+    def test_unchanged_listing_is_not_modified(self):
+        etag = self.client.get("/venues").headers["ETag"]
+        response = self.client.get("/venues", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+    def test_stale_etag_renders_page(self):
+        response = self.client.get(
+            "/artists", headers={"If-None-Match": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_is_rendered_again_before_its_csrf_token_expires(self):
+        time_limit = app.config["WTF_CSRF_TIME_LIMIT"]
+        start = 1000 * time_limit
+        with patch("time.time", return_value=start):
+            etag = self.client.get("/venues").headers["ETag"]
+        with patch("time.time", return_value=start + time_limit // 2 - 1):
+            response = self.client.get(
+                "/venues", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+        with patch("time.time", return_value=start + time_limit // 2):
+            response = self.client.get(
+                "/venues", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+
+
+class TestTypeahead(TestCase):
+    def create_app(self):
+        return app
+
+    def test_suggests_names_by_prefix_ignoring_case(self):
+        artist = Artist.query.first()
+        prefix = artist.name[:3].swapcase()
+        response = self.client.get(f"/artists/typeahead?q={prefix}&limit=100")
+        self.assertEqual(response.status_code, 200)
+        names = [item["name"] for item in response.json["data"]]
+        self.assertIn(artist.name, names)
+        self.assertTrue(
+            all(name.lower().startswith(prefix.lower()) for name in names))
+
+    def test_limit_caps_suggestions(self):
+        response = self.client.get("/venues/typeahead?limit=1")
+        self.assertEqual(len(response.json["data"]), 1)
+
+
+class TestSearch(TestCase):
+    NAMES = ["The Quillon Trio", "Aquillonia", "Quillon Live",
+             "Quillon 100% Live", "Quillon 1000 Live", "Quillon_Live"]
+
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        db.session.add_all(
+            Artist(name=name, city="Tulsa", state="OK") for name in self.NAMES)
+        db.session.add(Artist(name="Hollow Bones", city="Quillonville",
+                              state="OK"))
+        db.session.commit()
+        self.addCleanup(self.delete_artists)
+
+    def delete_artists(self):
+        db.session.rollback()
+        Artist.query.filter(Artist.state == "OK").delete()
+        db.session.commit()
+
+    def names(self, term):
+        return [row.name for row in search.ranked(Artist, term)]
+
+    def test_names_starting_with_the_term_come_first(self):
+        names = self.names("quillon")
+        self.assertEqual(
+            set(names[:4]),
+            {name for name in self.NAMES if name.startswith("Quillon")})
+        # Whole words before mere substrings of the name.
+        self.assertLess(names.index("The Quillon Trio"),
+                        names.index("Aquillonia"))
+
+    def test_words_match_names_and_cities_by_prefix(self):
+        self.assertEqual(self.names("quil tri"), ["The Quillon Trio"])
+        self.assertIn("Hollow Bones", self.names("quillonv"))
+
+    def test_substrings_match_without_the_full_text_index(self):
+        self.assertEqual(self.names("uillonia"), ["Aquillonia"])
+
+    def test_wildcards_in_the_term_match_literally(self):
+        self.assertEqual(self.names("%"), ["Quillon 100% Live"])
+        self.assertEqual(self.names("0%"), ["Quillon 100% Live"])
+        self.assertEqual(self.names("n_L"), ["Quillon_Live"])
+
+
+class TestGenres(TestCase):
+    def create_app(self):
+        return app
+
+    def test_facets_count_genres_of_matching_venues(self):
+        venue = Venue.query.first()
+        response = self.client.get(f"/venues/facets?state={venue.state}")
+        self.assertEqual(response.status_code, 200)
+        counts = {item["name"]: item["count"]
+                  for item in response.json["genres"]}
+        expected = sum(
+            other.state == venue.state and venue.genres[0] in other.genres
+            for other in Venue.query)
+        self.assertEqual(counts[venue.genres[0]], expected)
+
+    def test_listing_filters_by_genre(self):
+        artist = Artist.query.first()
+        genre = artist.genres[0]
+        response = self.client.get(f"/artists?genre={genre}")
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        for other in Artist.query:
+            self.assertEqual(f'href="/artists/{other.id}"' in page,
+                             genre in other.genres)
+
+    def test_genres_are_assigned_by_name(self):
+        venue = Venue(genres=["Jazz", "Unknown", "Blues"])
+        self.assertEqual(venue.genres, ["Blues", "Jazz"])
+
+
+class TestShowCalendar(TestCase):
+    def create_app(self):
+        return app
+
+    def test_groups_shows_by_month_with_counts(self):
+        response = self.client.get("/shows?group=month")
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        months = {}
+        for show in Show.query:
+            month = show.start_time.strftime("%B %Y")
+            months[month] = months.get(month, 0) + 1
+        for month, count in months.items():
+            self.assertIn(month, page)
+            self.assertIn(f"{count} show", page)
+
+    def test_whole_window_is_streamed(self):
+        response = self.client.get("/shows?from=2000-01-01&to=2099-12-31")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        page = response.get_data(as_text=True)
+        self.assertEqual(page.count("tile-show"), Show.query.count())
+
+    def test_window_and_venue_filters(self):
+        show = Show.query.first()
+        day = show.start_time.strftime("%Y-%m-%d")
+        response = self.client.get(
+            f"/shows?from={day}&to={day}&venue_id={show.venue_id}")
+        expected = Show.query.filter(
+            Show.venue_id == show.venue_id,
+            db.func.date(Show._start_time) == day).count()
+        self.assertEqual(
+            response.get_data(as_text=True).count("tile-show"), expected)
+
+    def test_malformed_filters_are_rejected(self):
+        self.assertEqual(self.client.get("/shows?from=soon").status_code, 400)
+        self.assertEqual(self.client.get("/shows?group=year").status_code, 400)
+
+
+class TestPagination(TestCase):
+    keys = (Artist.name, Artist.id)
+
+    def create_app(self):
+        return app
+
+    def names(self, page):
+        return [artist.name for artist in page]
+
+    def test_cursor_round_trips_sort_keys(self):
+        keys = (Show._start_time, Show.id)
+        values = [datetime(2040, 6, 1, 20, 30), 7]
+        cursor = pagination.encode_cursor(values)
+        self.assertRegex(cursor, r"^[A-Za-z0-9_=-]+$")
+        self.assertEqual(pagination.decode_cursor(cursor, keys), values)
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ("garbage", pagination.encode_cursor([1])):
+            with self.assertRaises(ValueError):
+                pagination.decode_cursor(cursor, self.keys)
+        response = self.client.get("/artists?after=garbage")
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_values_must_match_the_key_types(self):
+        for values in ([[1], {"a": 2}], [1, "2"], ["Guns N Petals", True],
+                       ["Guns N Petals", None]):
+            cursor = pagination.encode_cursor(values)
+            with self.subTest(values=values):
+                with self.assertRaises(ValueError):
+                    pagination.decode_cursor(cursor, self.keys)
+                for argument in ("after", "before"):
+                    response = self.client.get(f"/artists?{argument}={cursor}")
+                    self.assertEqual(response.status_code, 400)
+        cursor = pagination.encode_cursor(["2040-06-01", 1])
+        response = self.client.get(f"/shows?after={cursor}")
+        self.assertEqual(response.status_code, 200)
+        cursor = pagination.encode_cursor([20400601, 1])
+        response = self.client.get(f"/shows?after={cursor}")
+        self.assertEqual(response.status_code, 400)
+
+    def test_pages_walk_forward_and_back(self):
+        names = [name for name, in db.session.query(Artist.name)
+                 .order_by(*self.keys)]
+        pages = [pagination.paginate(Artist.query, self.keys, per_page=1)]
+        self.assertFalse(pages[0].has_prev)
+        while pages[-1].has_next:
+            pages.append(pagination.paginate(
+                Artist.query, self.keys, after=pages[-1].next_cursor,
+                per_page=1))
+        self.assertEqual(
+            [name for page in pages for name in self.names(page)], names)
+
+        page = pages[-1]
+        back = []
+        while page.has_prev:
+            page = pagination.paginate(
+                Artist.query, self.keys, before=page.prev_cursor,
+                per_page=1)
+            back.extend(self.names(page))
+        self.assertEqual(back, names[-2::-1])
+
+    def test_links_keep_the_other_arguments(self):
+        def args(url):
+            return {name: values[0] for name, values in
+                    parse_qs(urlsplit(url).query).items()}
+
+        with app.test_request_context("/artists?state=CA&per_page=1"):
+            page = pagination.paginate_request(Artist.query, self.keys)
+            self.assertIsNone(page.prev_url)
+            self.assertEqual(args(page.next_url), {
+                "state": "CA", "per_page": "1", "after": page.next_cursor})
+            following = pagination.paginate(
+                Artist.query, self.keys, after=page.next_cursor, per_page=1)
+        with app.test_request_context(
+                f"/artists?state=CA&after={page.next_cursor}"):
+            self.assertEqual(args(following.prev_url), {
+                "state": "CA", "before": following.prev_cursor})
+
+    def test_page_size_is_capped(self):
+        with patch.dict(app.config, MAX_PAGE_SIZE=2):
+            for per_page, expected in (("50", 2), ("0", 1)):
+                with app.test_request_context(
+                        f"/artists?per_page={per_page}"):
+                    page = pagination.paginate_request(
+                        Artist.query, self.keys)
+                self.assertEqual(len(page.items), expected)
+
+
+class TestBookings(TestCase):
+    start_time = datetime(2040, 6, 1, 20, 0)
+
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        self.venue = Venue.query.order_by(Venue.id).first()
+        self.artists = Artist.query.order_by(Artist.id).limit(2).all()
+        db.session.add(Show(venue=self.venue, artist=self.artists[0],
+                            start_time=self.start_time, duration=120))
+        db.session.commit()
+        self.addCleanup(self.delete_shows)
+
+    def delete_shows(self):
+        db.session.rollback()
+        Show.query.filter(Show._start_time >= datetime(2040, 1, 1)).delete()
+        db.session.commit()
+
+    def post(self, start_time, duration=60):
+        data = {
+            "artist_id": self.artists[1].id,
+            "venue_id": self.venue.id,
+            "start_time": start_time,
+            "duration": duration,
+        }
+        with patch.dict(app.config, WTF_CSRF_ENABLED=False):
+            response = self.client.post(
+                "/shows/create", data=data, follow_redirects=True)
+        return response.get_data(as_text=True)
+
+    def test_form_reports_venue_booked_at_that_time(self):
+        page = self.post("2040-06-01 21:30:00")
+        self.assertIn("The venue is already booked at that time.", page)
+        self.assertEqual(
+            Show.query.filter(Show._start_time >= self.start_time).count(), 1)
+
+    def test_booking_made_after_validation_is_reported(self):
+        with patch("schedule.conflicts", return_value={}):
+            page = self.post("2040-06-01 21:30:00")
+        self.assertIn("The venue is already booked at that time.", page)
+
+    def test_back_to_back_shows_are_listed(self):
+        page = self.post("2040-06-01 22:00:00")
+        self.assertIn("Show was successfully listed!", page)
+
+    def test_database_rejects_overlapping_shows(self):
+        db.session.add(Show(venue=self.venue, artist=self.artists[1],
+                            start_time=datetime(2040, 6, 1, 19, 0),
+                            duration=90))
+        with self.assertRaises(IntegrityError) as context:
+            db.session.commit()
+        self.assertEqual(
+            schedule.booking_conflict(context.exception)[0], "venue_id")
+
+    def test_overlaps_are_found_to_the_microsecond(self):
+        start_time = datetime(2040, 6, 2, 20, 0, 0, 500000)
+        db.session.add(Show(venue=self.venue, artist=self.artists[0],
+                            start_time=start_time, duration=60))
+        db.session.commit()
+        for offset, overlaps in ((250000, True), (500000, False)):
+            show = {"venue_id": self.venue.id,
+                    "artist_id": self.artists[1].id,
+                    "start_time": datetime(2040, 6, 2, 21, 0, 0, offset),
+                    "duration": 60}
+            with self.subTest(start_time=show["start_time"]):
+                self.assertEqual(bool(schedule.conflicts(**show)), overlaps)
+                db.session.add(Show(**show))
+                if overlaps:
+                    with self.assertRaises(IntegrityError):
+                        db.session.commit()
+                    db.session.rollback()
+                else:
+                    db.session.commit()
+
+    def test_duration_is_bounded(self):
+        record = {"artist_id": 1, "venue_id": 1,
+                  "start_time": "2040-06-01 20:00:00"}
+        values, _ = validation.SHOW.validate(record)
+        self.assertEqual(values["duration"], 120)
+        _, errors = validation.SHOW.validate(dict(record, duration=0))
+        self.assertIn("duration", errors)
+
+
+class TestScheduleBatch(TestCase):
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        self.venues = [
+            venue.id for venue in Venue.query.order_by(Venue.id).limit(3)]
+        self.artist_id = Artist.query.order_by(Artist.id).first().id
+        self.addCleanup(self.delete_shows)
+
+    def delete_shows(self):
+        db.session.rollback()
+        Show.query.filter(Show._start_time >= datetime(2040, 1, 1)).delete()
+        db.session.commit()
+
+    def post(self, **fields):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, many):
+            statements.append(statement)
+
+        data = dict(artist_id=self.artist_id, duration=90, **fields)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            with patch.dict(app.config, WTF_CSRF_ENABLED=False):
+                response = self.client.post("/shows/schedule", data=data)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        inserts = [statement for statement in statements
+                   if statement.startswith('INSERT INTO "Show"')]
+        return response, inserts
+
+    def scheduled(self):
+        return Show.query.filter(
+            Show._start_time >= datetime(2040, 1, 1)).count()
+
+    def test_tour_is_inserted_by_one_statement(self):
+        dates = "\n".join(
+            f"{venue_id}, 2040-03-0{day} 20:00:00"
+            for day, venue_id in enumerate(self.venues, 1))
+        response, inserts = self.post(dates=dates)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.scheduled(), len(self.venues))
+
+    def test_residency_repeats_by_rule(self):
+        response, _ = self.post(
+            venue_id=self.venues[0], start_time="2040-03-02 21:00:00",
+            rule="FREQ=WEEKLY;BYDAY=FR;COUNT=4")
+        self.assertEqual(response.status_code, 302)
+        starts = [show.start_time for show in Show.query.filter(
+            Show._start_time >= datetime(2040, 1, 1))]
+        self.assertEqual(len(starts), 4)
+        self.assertTrue(all(start.weekday() == 4 for start in starts))
+
+    def test_errors_are_reported_per_show_and_nothing_is_inserted(self):
+        venue_id = self.venues[0]
+        dates = (f"{venue_id}, 2040-03-01 20:00:00\n"
+                 f"999999, 2040-03-02 20:00:00\n"
+                 f"{venue_id}, 2040-03-01 21:00:00\n"
+                 f"{venue_id}, tomorrow")
+        response, inserts = self.post(dates=dates)
+        self.assertEqual(response.status_code, 400)
+        page = response.get_data(as_text=True)
+        self.assertIn("Line 2: Unknown venue 999999.", page)
+        self.assertIn(
+            "Line 3: The venue is already booked at that time.", page)
+        self.assertIn("Line 4: Not a valid datetime value.", page)
+        self.assertNotIn("Line 1:", page)
+        self.assertEqual(inserts, [])
+        self.assertEqual(self.scheduled(), 0)
+
+    def test_endless_rule_is_rejected(self):
+        response, _ = self.post(
+            venue_id=self.venues[0], start_time="2040-03-02 21:00:00",
+            rule="FREQ=DAILY")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f"more than {schedule.MAX_BATCH} shows",
+                      response.get_data(as_text=True))
+
+
+class TestBulkImport(TestCase):
+    record = {
+        "name": "Imported Band",
+        "city": "Austin",
+        "state": "TX",
+        "phone": "512-555-0100",
+        "genres": "Jazz, Funk",
+    }
+
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        self.addCleanup(self.delete_rows)
+        self.statements = []
+
+    def delete_rows(self):
+        db.session.rollback()
+        Show.query.filter(Show._start_time >= datetime(2040, 1, 1)).delete()
+        Artist.query.filter(Artist.name.startswith("Imported")).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+    def record_inserts(self, conn, cursor, statement, parameters, context,
+                       many):
+        if statement.startswith("INSERT"):
+            self.statements.append(statement)
+
+    def show(self, day, hour, venue_index=0):
+        venue_id = Venue.query.order_by(Venue.id)[venue_index].id
+        return {
+            "artist_id": str(Artist.query.order_by(Artist.id).first().id),
+            "venue_id": str(venue_id),
+            "start_time": f"2040-05-{day:02d} {hour:02d}:00:00",
+        }
+
+    def test_invalid_records_are_rejected_and_genres_linked(self):
+        records = [
+            (2, dict(self.record, name="Imported One")),
+            (3, dict(self.record, name="Imported Two", phone="555")),
+            (4, None),
+            (5, dict(self.record, name="Imported Three", genres="Opera")),
+            (6, dict(self.record, name="Imported Four", genres="Soul")),
+        ]
+        with patch.object(validation.ARTIST, "validate_many",
+                          wraps=validation.ARTIST.validate_many) as validate:
+            report = bulk.import_records("artists", records, batch_size=2)
+        # Once per batch of two records.
+        self.assertEqual(validate.call_count, 3)
+        self.assertEqual(report.inserted, 2)
+        self.assertEqual(
+            [error["line"] for error in report.errors], [3, 4, 5])
+        self.assertEqual(report.errors[0]["errors"], ["phone: Invalid phone."])
+        genres = {
+            artist.name: artist.genres for artist in
+            Artist.query.filter(Artist.name.startswith("Imported"))
+        }
+        self.assertEqual(genres, {
+            "Imported One": ["Funk", "Jazz"], "Imported Four": ["Soul"]})
+
+    def test_rows_are_inserted_a_batch_per_statement(self):
+        records = [(line, self.show(line, 20)) for line in range(1, 6)]
+        event.listen(db.engine, "before_cursor_execute", self.record_inserts)
+        try:
+            report = bulk.import_records(
+                "shows", records, batch_size=2, copy=False)
+        finally:
+            event.remove(
+                db.engine, "before_cursor_execute", self.record_inserts)
+        self.assertEqual(report.inserted, 5)
+        self.assertEqual(report.errors, [])
+        show_inserts = [statement for statement in self.statements
+                        if statement.startswith('INSERT INTO "Show"')]
+        self.assertEqual(len(show_inserts), 3)
+
+    def test_overlapping_shows_are_rejected_with_their_booking(self):
+        bulk.import_records("shows", [(1, self.show(1, 20))])
+        records = [
+            # Overlaps the show imported above.
+            (2, self.show(1, 21)),
+            # Overlaps the rejected show only, which books nothing.
+            (3, dict(self.show(1, 22), start_time="2040-05-01 22:30:00")),
+            (4, self.show(2, 20)),
+            # Overlaps the show of line 4 at another venue.
+            (5, self.show(2, 21, venue_index=1)),
+        ]
+        report = bulk.import_records("shows", records, batch_size=10)
+        self.assertEqual(report.inserted, 2)
+        self.assertEqual(report.errors, [
+            {"line": 2, "errors": [
+                "venue_id: The venue is already booked at that time.",
+                "artist_id: The artist is already booked at that time."]},
+            {"line": 5, "errors": [
+                "artist_id: The artist is already booked at that time."]},
+        ])
+
+    def test_failed_batch_is_retried_row_by_row(self):
+        records = [
+            (2, self.show(1, 20)),
+            # Same venue and artist an hour later, rejected by the database
+            # as the booking check is skipped.
+            (3, self.show(1, 21)),
+            (4, self.show(2, 20)),
+            (5, dict(self.show(3, 20), venue_id="999999")),
+        ]
+        with patch("schedule.batch_conflicts",
+                   side_effect=lambda shows: [{} for _ in shows]):
+            report = bulk.import_records("shows", records, batch_size=10)
+        self.assertEqual(report.inserted, 2)
+        self.assertEqual(
+            [error["line"] for error in report.errors], [5, 3])
+        self.assertEqual(report.errors[0]["errors"],
+                         ["venue_id: Unknown id 999999."])
+        self.assertIn("booking", report.errors[1]["errors"][0])
+        self.assertEqual(Show.query.filter(
+            Show._start_time >= datetime(2040, 1, 1)).count(), 2)
+
+
+class TestValidation(unittest.TestCase):
+    record = {
+        "name": "Band",
+        "city": "Austin",
+        "state": "TX",
+        "phone": "512-555-0100",
+        "genres": "Jazz, Funk",
+        "seeking_venue": "yes",
+    }
+
+    def test_valid_record_is_cleaned(self):
+        values, errors = validation.ARTIST.validate(self.record)
+        self.assertEqual(errors, {})
+        self.assertEqual(values["genres"], ["Jazz", "Funk"])
+        self.assertIs(values["seeking_venue"], True)
+
+    def test_invalid_fields_are_reported(self):
+        record = dict(self.record, phone="555", state="XX", website="nope")
+        values, errors = validation.ARTIST.validate(record)
+        self.assertIsNone(values)
+        self.assertEqual(set(errors), {"phone", "state", "website"})
+
+    def test_batch_is_validated_in_order(self):
+        records = [self.record, dict(self.record, phone="555"), {}]
+        results = list(validation.ARTIST.validate_many(records))
+        self.assertEqual(
+            [set(errors) for _, errors in results],
+            [set(), {"phone"}, {"name", "city", "state", "phone", "genres"}])
+        self.assertEqual(results[0][0]["city"], "Austin")
+
+
+class TestDatetimeFilter(unittest.TestCase):
+    # Named formats and the Babel patterns of the show calendar.
+    FORMATS = ["full", "medium", "EEEE, MMMM d, y", "'Week of' MMMM d, y",
+               "MMMM y"]
+    PATTERNS = {"full": "EEEE MMMM, d, y 'at' h:mma",
+                "medium": "EE MM, dd, y h:mma"}
+    DATES = [datetime(2035, 4, 1, 20, 0), datetime(2019, 6, 15, 23, 5, 30)]
+
+    def expected(self, value, format_):
+        """Output of the filter before the patterns were memoized."""
+        return babel.dates.format_datetime(
+            dateutil.parser.parse(value),
+            self.PATTERNS.get(format_, format_), locale="en")
+
+    def test_datetimes_and_strings_are_formatted_alike(self):
+        for date in self.DATES:
+            for format_ in self.FORMATS:
+                with self.subTest(date=date, format_=format_):
+                    expected = self.expected(str(date), format_)
+                    self.assertEqual(format_datetime(date, format_), expected)
+                    self.assertEqual(
+                        format_datetime(str(date), format_), expected)
+                    self.assertEqual(
+                        format_datetime(date.isoformat(), format_), expected)
+
+    def test_medium_is_the_default(self):
+        date = self.DATES[0]
+        self.assertEqual(format_datetime(date),
+                         format_datetime(str(date), "medium"))
+
+
+class TestEngineOptions(unittest.TestCase):
+    config = {
+        "SQLALCHEMY_DATABASE_URI": "postgresql://localhost/fyyur",
+        "DB_POOL_SIZE": 3,
+        "DB_MAX_OVERFLOW": 2,
+        "DB_POOL_TIMEOUT": 5,
+        "DB_POOL_RECYCLE": 60,
+        "DB_POOL_PRE_PING": True,
+        "DB_POOL_SLOW_WAIT": 0.1,
+        "DB_STATEMENT_TIMEOUT": 2000,
+        "DB_PGBOUNCER": False,
+    }
+
+    def test_pool_is_sized_from_config(self):
+        options = dbpool.engine_options(self.config)
+        self.assertIs(options["poolclass"], dbpool.InstrumentedQueuePool)
+        self.assertEqual(options["pool_size"], 3)
+        self.assertEqual(
+            options["connect_args"], {"options": "-c statement_timeout=2000"})
+
+    def test_pgbouncer_sends_no_startup_options(self):
+        options = dbpool.engine_options(dict(self.config, DB_PGBOUNCER=True))
+        self.assertIs(options["poolclass"], NullPool)
+        self.assertNotIn("connect_args", options)
+
+    def pgbouncer_engine(self, uri):
+        options = dbpool.engine_options(dict(
+            self.config, SQLALCHEMY_DATABASE_URI=uri, DB_PGBOUNCER=True))
+        engine = create_engine(uri, **options)
+        self.addCleanup(engine.dispose)
+        return engine
+
+    def test_pgbouncer_timeout_listens_on_the_app_engines_only(self):
+        uri = self.config["SQLALCHEMY_DATABASE_URI"]
+        self.assertEqual(len(self.pgbouncer_engine(uri).dispatch.begin), 1)
+        self.assertEqual(len(create_engine(uri).dispatch.begin), 0)
+
+    def test_foreign_keys_are_enforced_on_the_app_engines_only(self):
+        options = dbpool.engine_options(
+            {"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+        for engine, enforced in ((create_engine("sqlite://", **options), 1),
+                                 (create_engine("sqlite://"), 0)):
+            self.addCleanup(engine.dispose)
+            with engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql(
+                    "PRAGMA foreign_keys").scalar(), enforced)
+
+    def test_pgbouncer_timeout_is_set_per_transaction(self):
+        uri = os.environ["SQLALCHEMY_DATABASE_URI"]
+        if not uri.startswith("postgresql"):
+            self.skipTest("Needs PostgreSQL.")
+        with self.pgbouncer_engine(uri).begin() as connection:
+            self.assertEqual(connection.exec_driver_sql(
+                "SHOW statement_timeout").scalar(), "2s")
+
+
+class TestReadReplicas(TestCase):
+    """Uses the test database as its own replica, through another engine."""
+
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        app.config["SQLALCHEMY_BINDS"] = {
+            "replica1": app.config["SQLALCHEMY_DATABASE_URI"]}
+        app.config["REPLICA_BINDS"] = ["replica1"]
+        routing._down_until.clear()
+        primary = db.get_engine(app)
+        self.shared = primary.dialect.name == "sqlite"
+        if self.shared:
+            # An in-memory database lives in its single connection, which
+            # the replica engine shares instead of opening an empty one.
+            connection = primary.raw_connection().connection
+            self.replica = create_engine(
+                "sqlite://", creator=lambda: connection, poolclass=StaticPool)
+            get_state(app).connectors["replica1"] = SimpleNamespace(
+                get_engine=lambda: self.replica)
+        else:
+            self.replica = db.get_engine(app, bind="replica1")
+        self.statements = []
+        event.listen(self.replica, "before_cursor_execute", self.capture)
+
+    def tearDown(self):
+        event.remove(self.replica, "before_cursor_execute", self.capture)
+        app.config["SQLALCHEMY_BINDS"] = {}
+        app.config["REPLICA_BINDS"] = []
+        routing._down_until.clear()
+        db.session.remove()
+        get_state(app).connectors.pop("replica1")
+        # Disposing the shared engine would close the primary connection.
+        if not self.shared:
+            self.replica.dispose()
+
+    def capture(self, conn, cursor, statement, parameters, context, many):
+        self.statements.append(statement)
+
+    def test_read_only_view_reads_from_replica(self):
+        response = self.client.get("/artists")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.statements)
+        self.assertEqual(routing._down_until, {})
+
+    def test_reads_stick_to_primary_after_own_write(self):
+        with self.client.session_transaction() as session:
+            session["db_primary_until"] = time.time() + 60
+        self.client.get("/artists")
+        self.assertEqual(self.statements, [])
+        self.assertEqual(routing._down_until, {})
+
+
+class TestReplicaPageCache(TestReadReplicas):
+    """Page cache in front of a replica, with PAGE_CACHE_BACKEND=memory."""
+
+    def setUp(self):
+        super().setUp()
+        self.backend = page_cache.backend
+        page_cache.backend = create_backend(
+            dict(app.config, PAGE_CACHE_BACKEND="memory"))
+
+    def tearDown(self):
+        page_cache.backend = self.backend
+        super().tearDown()
+
+    def page_cache_calls(self, method, url):
+        """Keys of the pages the backend got or set while serving the url."""
+        with patch.object(page_cache.backend, method,
+                          wraps=getattr(page_cache.backend, method)) as call:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [args[0] for args, _ in call.call_args_list
+                if args[0].startswith("page:")]
+
+    def test_writer_does_not_use_the_page_cache(self):
+        self.assertTrue(self.page_cache_calls("set", "/artists"))
+        with self.client.session_transaction() as session:
+            session["db_primary_until"] = time.time() + 60
+        self.assertEqual(self.page_cache_calls("get", "/artists"), [])
+        page_cache.invalidate("artists")
+        self.assertEqual(self.page_cache_calls("set", "/artists"), [])
+
+    def test_replica_pages_are_not_cached_right_after_invalidation(self):
+        page_cache.invalidate("artists")
+        self.assertEqual(self.page_cache_calls("set", "/artists"), [])
+        self.assertTrue(self.statements)
+        with patch.dict(app.config, REPLICA_STICKY_SECONDS=0):
+            self.assertTrue(self.page_cache_calls("set", "/artists"))
+
+
+class TestSQLInstrumentation(TestCase):
+    def create_app(self):
+        app.config["SQL_DEBUG_HEADER"] = True
+        return app
+
+    def tearDown(self):
+        app.config["SQL_DEBUG_HEADER"] = False
+
+    def test_debug_header_counts_queries(self):
+        response = self.client.get("/venues")
+        self.assertRegex(response.headers["X-SQL-Stats"], r"^queries=\d+;")
+        metrics = self.client.get("/metrics/sql").json["endpoints"]
+        self.assertGreater(metrics["venues"]["queries"], 0)
+
+    def test_lazy_loads_in_a_loop_are_n_plus_one(self):
+        with app.test_request_context(), patch.dict(
+            app.config, SQL_N_PLUS_ONE_THRESHOLD=2
+        ):
+            g.sql_queries = []
+            for venue in Venue.query.limit(2):
+                venue.shows
+            repeated = sql_instrumentation.n_plus_one(g.sql_queries)
+        self.assertEqual(list(repeated.values()), [2])
+
+
+class TestMetrics(TestCase):
+    def create_app(self):
+        return app
+
+    def test_requests_and_templates_are_exposed(self):
+        self.client.get("/venues")
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn(
+            'fyyur_requests_total{endpoint="venues",method="GET",'
+            'status="200"}', text)
+        self.assertIn(
+            "fyyur_template_render_seconds_count"
+            '{template="pages/venues.html"}', text)
+
+    def test_worker_snapshots_are_added_up(self):
+        registry = metrics.Registry()
+        registry.inc("hits", {"endpoint": "venues"})
+        registry.observe("latency", {}, 0.02)
+        merged = metrics.merge([registry.snapshot(), registry.snapshot()])
+        text = metrics.render(merged)
+        self.assertIn('hits{endpoint="venues"} 2', text)
+        self.assertIn('latency_bucket{le="0.025"} 2', text)
+        self.assertIn("latency_count 2", text)
+
+    def test_registries_of_exited_processes_are_deleted(self):
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        registry = metrics.Registry()
+        registry.inc("hits", {})
+        with tempfile.TemporaryDirectory() as directory:
+            names = [f"{os.getppid()}.json", f"{exited.pid}.json",
+                     f"{exited.pid}.json.1.tmp"]
+            for name in names:
+                with open(os.path.join(directory, name), "w") as file:
+                    json.dump(registry.snapshot(), file)
+            other_app = Flask(__name__)
+            other_app.config.update(
+                METRICS_DIR=directory, METRICS_FLUSH_SECONDS=1)
+            other = metrics.Metrics(other_app)
+            self.assertEqual(os.listdir(directory), names[:1])
+            text = metrics.render(other.snapshot())
+        self.assertIn("hits 1", text)
+
+
+class TestRecordAndReplay(TestCase):
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        self.trace = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        self.trace.close()
+        self.wsgi_app = app.wsgi_app
+        app.wsgi_app = RequestRecorder(app.wsgi_app, self.trace.name)
+
+    def tearDown(self):
+        app.wsgi_app = self.wsgi_app
+        os.remove(self.trace.name)
+
+    def test_recorded_requests_are_replayed_per_route(self):
+        self.client.get("/venues?per_page=2")
+        self.client.post("/artists/search", data={"search_term": "a"})
+        records = list(replay.read_trace(self.trace.name))
+        self.assertEqual(
+            [(record["method"], record["path"]) for record in records],
+            [("GET", "/venues"), ("POST", "/artists/search")])
+        self.assertEqual(records[1]["form"], {"search_term": ["a"]})
+
+        app.wsgi_app = self.wsgi_app
+        # Forms are replayed with a CSRF token of their own, and the
+        # configuration is left alone.
+        with patch.dict(app.config, WTF_CSRF_ENABLED=True):
+            results, seconds = replay.replay(
+                records, replay.TestClientRunner(app), concurrency=2)
+            self.assertTrue(app.config["WTF_CSRF_ENABLED"])
+        summary = replay.summarize(app, results, seconds)
+        self.assertEqual(summary["<all>"]["requests"], 2)
+        self.assertEqual(summary["search_artists"]["errors"], 0)
+        venues = summary["venues"]
+        self.assertLessEqual(venues["p50"], venues["p99"])
+
+
+class TestExport(TestCase):
+    def create_app(self):
+        return app
+
+    def test_csv_export_lists_every_row(self):
+        response = self.client.get("/export/venues.csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines) - 1, Venue.query.count())
+
+    def test_unknown_format_is_not_found(self):
+        response = self.client.get("/export/venues.xml")
+        self.assertEqual(response.status_code, 404)
+
+    def test_exported_shows_are_imported_again(self):
+        shows = [
+            (show.artist_id, show.venue_id, show.start_time, show.duration)
+            for show in Show.query.order_by(Show.id)
+        ]
+        text = "".join(bulk.export_csv(
+            "shows", bulk.stream_partitions("shows")))
+        self.assertTrue(text.startswith("id,artist_id,venue_id,start_time,"))
+        Show.query.delete()
+        db.session.commit()
+        self.addCleanup(self.restore_shows, shows)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shows.csv")
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                file.write(text)
+            report = bulk.import_records("shows", bulk.read_records(path))
+        self.assertEqual(report.errors, [])
+        self.assertEqual(report.inserted, len(shows))
+        imported = [
+            (show.artist_id, show.venue_id, show.start_time, show.duration)
+            for show in Show.query.order_by(Show.id)
+        ]
+        self.assertEqual(imported, shows)
+
+    def restore_shows(self, shows):
+        db.session.rollback()
+        Show.query.delete()
+        db.session.add_all(
+            Show(artist_id=artist_id, venue_id=venue_id,
+                 start_time=start_time, duration=duration)
+            for artist_id, venue_id, start_time, duration in shows
+        )
+        db.session.commit()
+
+
+class TestSeed(unittest.TestCase):
+    today = datetime(2030, 1, 1)
+
+    def generate(self, seed_):
+        rng = random.Random(seed_)
+        artists = list(seed.artists(rng, 20))
+        shows = list(seed.shows(rng, 500, range(1, 21), range(1, 6),
+                                self.today))
+        for row in artists + shows:
+            del row["updated_at"]
+        return artists, shows
+
+    def test_same_seed_gives_same_rows(self):
+        self.assertEqual(self.generate(1), self.generate(1))
+        self.assertNotEqual(self.generate(1), self.generate(2))
+
+    def test_shows_are_mostly_past_and_skewed(self):
+        _, shows = self.generate(1)
+        past = sum(show["_start_time"] < self.today for show in shows)
+        self.assertGreater(past, len(shows) // 2)
+        venues = [show["venue_id"] for show in shows]
+        busiest = max(venues.count(id_) for id_ in set(venues))
+        self.assertGreater(busiest, len(shows) // 5)
+
+    def test_shows_of_a_venue_or_artist_do_not_overlap(self):
+        _, shows = self.generate(1)
+        for column in ("venue_id", "artist_id"):
+            bookings = {}
+            for show in shows:
+                bookings.setdefault(show[column], []).append(
+                    (show["_start_time"], show["_start_time"] + timedelta(
+                        minutes=show["duration"])))
+            for times in bookings.values():
+                times.sort()
+                for (_, end), (start, _) in zip(times, times[1:]):
+                    self.assertLessEqual(end, start)
+
+
+class TestBenchmark(TestCase):
+    def create_app(self):
+        return app
+
+    def test_measures_latency_queries_and_memory(self):
+        stats = benchmark.measure(
+            self.client, lambda: ("GET", "/venues", None), repeat=2)
+        self.assertGreater(stats["seconds"], 0)
+        self.assertGreater(stats["queries"], 0)
+        self.assertGreater(stats["memory"], 0)
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        baseline = {"small": {
+            "venues": {"seconds": 0.1, "queries": 2, "memory": 10 ** 6}}}
+        same = {"small": {
+            "venues": {"seconds": 0.11, "queries": 2, "memory": 10 ** 6}}}
+        worse = {"small": {
+            "venues": {"seconds": 0.2, "queries": 3, "memory": 10 ** 6}}}
+        self.assertEqual(benchmark.compare(same, baseline, 0.25), [])
+        self.assertEqual(len(benchmark.compare(worse, baseline, 0.25)), 2)
+        self.assertEqual(benchmark.compare(worse, {}, 0.25), [])
+
+
 if __name__ == "__main__":
     unittest.main()
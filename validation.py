@@ -0,0 +1,235 @@
+from wtforms.validators import HostnameValidation
+from model import SHOW_DURATION_DEFAULT, SHOW_DURATION_MAX
+from enums import Genre, State
+from functools import lru_cache
+from datetime import datetime
+
+import re
+
+# Built once at import, validating a row is then only lookups and matches.
+GENRES = frozenset(genre.value for genre in Genre)
+STATES = frozenset(state.value for state in State)
+
+# 1234567890, 123.456.7890, 123-456-7890, 123 456 7890 or (123) 456-7890.
+PHONE_PATTERN = re.compile(
+    r"^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$")
+
+# Same as the URL validator of WTForms.
+URL_PATTERN = re.compile(
+    r"^[a-z]+://"
+    r"(?P<host>[^\/\?:]+)"
+    r"(?P<port>:[0-9]+)?"
+    r"(?P<path>\/.*?)?"
+    r"(?P<query>\?.*)?$",
+    re.IGNORECASE,
+)
+# Hosts repeat across rows, e.g. image and social network links.
+_valid_host = lru_cache(maxsize=4096)(HostnameValidation(require_tld=True))
+
+TRUE_VALUES = frozenset(("1", "true", "y", "yes", "on"))
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+REQUIRED = "This field is required."
+
+
+def is_valid_phone(number):
+    """Whether the number looks like a 10 digit US phone number."""
+    return PHONE_PATTERN.match(number) is not None
+
+
+def is_valid_url(url):
+    """Whether the url is valid by the rules of the WTForms URL validator."""
+    match = URL_PATTERN.match(url)
+    return match is not None and _valid_host(match.group("host"))
+
+
+class Field:
+    """Cleans a single value of a record.
+
+    Args:
+        required: Reject missing and empty values.
+        default: Value of missing and empty optional values.
+        message: Error message of a present but invalid value.
+    """
+
+    def __init__(self, required=False, default=None, message=REQUIRED):
+        self.required = required
+        self.default = default
+        self.message = message
+
+    def clean(self, value):
+        """Returns the cleaned value.
+
+        Raises:
+            ValueError: The value is invalid, with the error message.
+        """
+        if value is None or value == "" or value == []:
+            if self.required:
+                raise ValueError(REQUIRED)
+            return self.default
+        return self.convert(value)
+
+    def convert(self, value):
+        return value
+
+
+class Text(Field):
+    def convert(self, value):
+        value = str(value)
+        if self.required and not value.strip():
+            raise ValueError(REQUIRED)
+        return value
+
+
+class Phone(Field):
+    def convert(self, value):
+        if not is_valid_phone(str(value)):
+            raise ValueError(self.message)
+        return str(value)
+
+
+class URL(Field):
+    def convert(self, value):
+        if not is_valid_url(str(value)):
+            raise ValueError(self.message)
+        return str(value)
+
+
+class Choice(Field):
+    def __init__(self, allowed, **options):
+        super().__init__(**options)
+        self.allowed = allowed
+
+    def convert(self, value):
+        if value not in self.allowed:
+            raise ValueError(self.message)
+        return value
+
+
+class Choices(Choice):
+    """Several choices, as a list or a comma separated string."""
+
+    def convert(self, value):
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(",")]
+        if not self.allowed.issuperset(value):
+            raise ValueError(self.message)
+        return list(value)
+
+
+class Boolean(Field):
+    def clean(self, value):
+        if isinstance(value, bool):
+            return value
+        return str(value).lower() in TRUE_VALUES if value else False
+
+
+class Integer(Field):
+    """Whole number, within minimum and maximum when given."""
+
+    def __init__(self, minimum=None, maximum=None, **options):
+        super().__init__(**options)
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def convert(self, value):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError("Not a valid integer value.") from None
+        if (self.minimum is not None and value < self.minimum
+                or self.maximum is not None and value > self.maximum):
+            raise ValueError(self.message)
+        return value
+
+
+class DateTime(Field):
+    def convert(self, value):
+        if isinstance(value, datetime):
+            return value
+        try:
+            return datetime.strptime(str(value), DATETIME_FORMAT)
+        except ValueError:
+            raise ValueError("Not a valid datetime value.") from None
+
+
+class Schema:
+    """Validation rules of a record, a mapping of field names to values.
+
+    Works on plain dicts, e.g. rows of a bulk import, and on the data of the
+    matching form, so both apply the same rules. Unknown keys are ignored.
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def validate(self, record):
+        """Returns (values, errors), where values maps every field to its
+        cleaned value, or is None when errors maps fields to messages."""
+        values, errors = {}, {}
+        for name, field in self.fields.items():
+            try:
+                values[name] = field.clean(record.get(name))
+            except ValueError as error:
+                errors[name] = [str(error)]
+        return (None, errors) if errors else (values, {})
+
+    def validate_many(self, records):
+        """Validates records one after another, yielding (values, errors)."""
+        validate = self.validate
+        for record in records:
+            yield validate(record)
+
+    def validate_form(self, form):
+        """Validates the data of a form, adding errors to its fields."""
+        _, errors = self.validate(form.data)
+        for name, messages in errors.items():
+            getattr(form, name).errors.extend(messages)
+        return not errors
+
+
+ARTIST = Schema(
+    name=Text(required=True),
+    city=Text(required=True),
+    state=Choice(STATES, required=True, message="Invalid state."),
+    phone=Phone(required=True, message="Invalid phone."),
+    image_link=URL(
+        message="Invalid Image Link",
+        default="https://placeimg.com/640/480/people/sepia",
+    ),
+    genres=Choices(GENRES, required=True, message="Invalid genres."),
+    facebook_link=URL(
+        message="Invalid Facebook Link", default="https://facebook.com"),
+    website=URL(message="Invalid Website Link"),
+    seeking_venue=Boolean(),
+    seeking_description=Text(),
+)
+
+VENUE = Schema(
+    name=Text(required=True),
+    city=Text(required=True),
+    state=Choice(STATES, required=True, message="Invalid state."),
+    address=Text(required=True),
+    phone=Phone(required=True, message="Invalid phone."),
+    image_link=URL(
+        message="Invalid Image Link",
+        default="https://placeimg.com/640/480/arch",
+    ),
+    genres=Choices(GENRES, required=True, message="Invalid genres."),
+    facebook_link=URL(
+        message="Invalid Facebook Link", default="https://facebook.com"),
+    website=URL(message="Invalid Website Link"),
+    seeking_talent=Boolean(),
+    seeking_description=Text(),
+)
+
+SHOW = Schema(
+    artist_id=Integer(required=True),
+    venue_id=Integer(required=True),
+    start_time=DateTime(required=True),
+    duration=Integer(
+        minimum=1,
+        maximum=SHOW_DURATION_MAX,
+        default=SHOW_DURATION_DEFAULT,
+        message=f"Shows last from 1 to {SHOW_DURATION_MAX} minutes.",
+    ),
+)